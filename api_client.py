@@ -5,20 +5,259 @@ Flux-Kontext API客户端
 
 import json
 import time
+import atexit
+import hashlib
+import threading
 import requests
 import re
-from typing import Optional, Dict, Any, List
+from requests.adapters import HTTPAdapter
+from typing import Optional, Dict, Any, List, Tuple
+from urllib.parse import urlparse
 try:
     from .config import FluxKontextConfig, default_config
-    from .utils import format_error_message, download_image
+    from .utils import format_error_message, fetch_image_bytes, decode_image
+    from .singleflight import make_fingerprint, get_flight, get_coalesce_metrics
+    from .endpoints import get_router
+    from .pipeline import get_pipeline
+    from .scheduler import get_scheduler
 except ImportError:
     from config import FluxKontextConfig, default_config
-    from utils import format_error_message, download_image
+    from utils import format_error_message, fetch_image_bytes, decode_image
+    from singleflight import make_fingerprint, get_flight, get_coalesce_metrics
+    from endpoints import get_router
+    from pipeline import get_pipeline
+    from scheduler import get_scheduler
 
 class FluxKontextAPIError(Exception):
     """API调用异常"""
     pass
 
+class FluxKontextAPIRejectedError(FluxKontextAPIError):
+    """
+    确定性的请求拒绝（内容审核、参数无效）
+    
+    相同请求重试也不会成功，因此不做重试。cacheable为True的拒绝只取决于请求本身，会写入负缓存。
+    """
+    
+    def __init__(self, message: str, status_code: Optional[int] = None, cacheable: bool = True):
+        super().__init__(message)
+        self.status_code = status_code
+        self.cacheable = cacheable
+
+# 表示请求本身无效的状态码：快速失败并写入负缓存。
+# 其余4xx（404、405、413、镜像防火墙的403等）可能只是某个端点的问题，按端点故障处理并切换端点
+_REJECTION_STATUS = (400, 422)
+# 错误类型或错误码中包含这些关键词时，说明是内容审核或参数无效导致的确定性拒绝
+_REJECTION_ERROR_KEYWORDS = (
+    "content_policy", "moderat", "safety", "nsfw",
+    "invalid_request", "invalid_param", "invalid_value", "validation",
+)
+
+# 负缓存: 请求指纹 -> (过期时间, 拒绝原因)
+_negative_cache: Dict[str, Tuple[float, str]] = {}
+_negative_cache_lock = threading.Lock()
+_NEGATIVE_CACHE_MAX_ENTRIES = 1024
+
+# 进程内共享的HTTP会话：所有客户端实例复用同一个连接池，
+# 这样预热建立的连接才能被后续的生成和下载请求使用
+_shared_session: Optional[requests.Session] = None
+_shared_session_lock = threading.Lock()
+
+# 健康检查结果缓存: (base_url, 密钥指纹) -> (检查时间, 是否健康)
+_health_cache: Dict[Tuple[str, str], Tuple[float, bool]] = {}
+_health_cache_lock = threading.Lock()
+
+# 预热状态：运行中观察到的CDN源站会被加入后续的周期性预热
+_observed_origins = set()
+_prewarm_lock = threading.Lock()
+_prewarm_thread: Optional[threading.Thread] = None
+# 最近一次生成请求的时间，空闲超过prewarm_idle_timeout后停止周期性预热
+_last_activity = time.monotonic()
+
+def get_shared_session(config: Optional[FluxKontextConfig] = None) -> requests.Session:
+    """
+    获取进程内共享的HTTP会话
+    
+    Args:
+        config: 配置对象，仅在首次创建会话时用于确定连接池大小
+        
+    Returns:
+        requests.Session: 共享会话
+    """
+    global _shared_session
+    with _shared_session_lock:
+        if _shared_session is None:
+            config = config or default_config
+            pool_maxsize = config.get_config('pool_maxsize', 16)
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_maxsize, pool_maxsize=pool_maxsize)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            session.headers['User-Agent'] = 'ComfyUI-TuZi-Flux-Kontext/1.0'
+            _shared_session = session
+        return _shared_session
+
+def close_shared_session():
+    """关闭共享HTTP会话并释放连接池中的所有连接，下次使用时会重新创建"""
+    global _shared_session
+    with _shared_session_lock:
+        if _shared_session is not None:
+            _shared_session.close()
+            _shared_session = None
+
+# 进程退出时释放连接
+atexit.register(close_shared_session)
+
+def _origin_of(url: str) -> Optional[str]:
+    """提取URL的源站（scheme://host[:port]）"""
+    parsed = urlparse(url)
+    if not parsed.scheme or not parsed.netloc:
+        return None
+    return f"{parsed.scheme}://{parsed.netloc}"
+
+def _remember_origin(url: str):
+    """记录实际访问过的CDN源站，供周期性预热使用"""
+    origin = _origin_of(url)
+    if origin:
+        with _prewarm_lock:
+            _observed_origins.add(origin)
+
+def prewarm_connections(config: Optional[FluxKontextConfig] = None) -> Dict[str, bool]:
+    """
+    预热到API和CDN的连接（DNS解析、TCP握手和TLS握手）
+    
+    使用HEAD请求访问各源站，建立的keep-alive连接会留在共享连接池中。
+    任何状态码都视为预热成功，只有网络层失败才算失败。
+    
+    Args:
+        config: 配置对象
+        
+    Returns:
+        Dict: 源站 -> 是否预热成功
+    """
+    config = config or default_config
+    session = get_shared_session(config)
+    timeout = config.get_config('health_check_timeout', 10)
+
+    urls = [url for url, _ in config.get_api_base_urls()] + list(config.get_config('prewarm_hosts', []) or [])
+    with _prewarm_lock:
+        urls.extend(sorted(_observed_origins))
+
+    results = {}
+    for url in urls:
+        origin = _origin_of(url or '')
+        if not origin or origin in results:
+            continue
+        try:
+            response = session.head(origin, timeout=timeout, allow_redirects=False)
+            response.close()
+            results[origin] = True
+        except requests.exceptions.RequestException:
+            results[origin] = False
+    return results
+
+def start_background_prewarm(config: Optional[FluxKontextConfig] = None) -> bool:
+    """
+    在后台守护线程中预热连接，不阻塞节点加载
+    
+    默认按prewarm_interval周期性重新预热（包括运行中观察到的CDN源站），
+    在服务器的keep-alive超时之前刷新连接，使空闲一段时间后的首次生成也不必承担冷连接延迟。
+    未配置API密钥时不预热；距上次生成超过prewarm_idle_timeout后停止，下次生成时由
+    note_activity 重新启动。
+    
+    Args:
+        config: 配置对象
+        
+    Returns:
+        bool: 是否启动了新的预热线程
+    """
+    global _prewarm_thread
+    config = config or default_config
+    if not config.get_config('prewarm_on_load', True) or not config.is_api_key_valid():
+        return False
+
+    with _prewarm_lock:
+        if _prewarm_thread is not None and _prewarm_thread.is_alive():
+            return False
+
+        def _run():
+            global _prewarm_thread
+            while True:
+                prewarm_connections(config)
+                interval = config.get_config('prewarm_interval', 45)
+                if not interval or interval <= 0:
+                    break
+                time.sleep(interval)
+                idle_timeout = config.get_config('prewarm_idle_timeout', 1800)
+                with _prewarm_lock:
+                    if idle_timeout and idle_timeout > 0 and time.monotonic() - _last_activity >= idle_timeout:
+                        # 在锁内清空，保证之后的 note_activity 能看到线程已停止并重新启动
+                        if _prewarm_thread is threading.current_thread():
+                            _prewarm_thread = None
+                        return
+
+        _prewarm_thread = threading.Thread(target=_run, name="FluxKontextPrewarm", daemon=True)
+        _prewarm_thread.start()
+        return True
+
+def note_activity(config: Optional[FluxKontextConfig] = None):
+    """记录一次生成请求；周期性预热因空闲而停止时重新启动"""
+    global _last_activity
+    config = config or default_config
+    with _prewarm_lock:
+        _last_activity = time.monotonic()
+        stopped = _prewarm_thread is None or not _prewarm_thread.is_alive()
+    interval = config.get_config('prewarm_interval', 45)
+    if stopped and interval and interval > 0:
+        start_background_prewarm(config)
+
+def _extract_error_message(error_data: Dict[str, Any]) -> str:
+    """从API错误响应中提取可读的错误信息"""
+    error = error_data.get('error')
+    if isinstance(error, dict):
+        return str(error.get('message') or error.get('type') or error)
+    return str(error)
+
+def _is_rejection(status_code: Optional[int], error_data: Any) -> bool:
+    """
+    判断错误是否为确定性拒绝
+    
+    400/422直接视为拒绝；其余情况（包括200响应体中的错误）只有在错误类型或错误码
+    明确表示内容审核或参数无效时才算，超时、过载等暂时性错误不算。
+    """
+    if status_code in _REJECTION_STATUS:
+        return True
+    if not isinstance(error_data, dict):
+        return False
+    error = error_data.get('error')
+    if not isinstance(error, dict):
+        return False
+    kind = f"{error.get('type') or ''} {error.get('code') or ''}".lower()
+    return any(keyword in kind for keyword in _REJECTION_ERROR_KEYWORDS)
+
+def _get_negative_cache(fingerprint: str) -> Optional[str]:
+    """查询负缓存，返回未过期的拒绝原因"""
+    with _negative_cache_lock:
+        entry = _negative_cache.get(fingerprint)
+        if entry is None:
+            return None
+        if time.monotonic() >= entry[0]:
+            del _negative_cache[fingerprint]
+            return None
+        return entry[1]
+
+def _put_negative_cache(fingerprint: str, reason: str, ttl: float):
+    """写入负缓存，同时清理过期条目并限制条目数"""
+    if not ttl or ttl <= 0:
+        return
+    now = time.monotonic()
+    with _negative_cache_lock:
+        for key in [k for k, (expires, _) in _negative_cache.items() if expires <= now]:
+            del _negative_cache[key]
+        while len(_negative_cache) >= _NEGATIVE_CACHE_MAX_ENTRIES:
+            del _negative_cache[next(iter(_negative_cache))]
+        _negative_cache[fingerprint] = (now + ttl, reason)
+
 class FluxKontextAPI:
     """Flux-Kontext API客户端类"""
     
@@ -35,18 +274,21 @@ class FluxKontextAPI:
             
         self.api_key = api_key
         self.config = config or default_config
-        self.session = requests.Session()
-        self._setup_session()
+        self.session = get_shared_session(self.config)
+        self._setup_headers()
     
-    def _setup_session(self):
-        """设置HTTP会话"""
-        self.session.headers.update({
+    def _setup_headers(self):
+        """设置请求头（会话是共享的，认证头按实例在每次请求时传入）"""
+        self.headers = {
             'Content-Type': 'application/json; charset=utf-8',
-            'User-Agent': 'ComfyUI-TuZi-Flux-Kontext/1.0'
-        })
-        
-        # 直接使用传入的API密钥设置认证头
-        self.session.headers['Authorization'] = f'Bearer {self.api_key}'
+            'User-Agent': 'ComfyUI-TuZi-Flux-Kontext/1.0',
+            # 直接使用传入的API密钥设置认证头
+            'Authorization': f'Bearer {self.api_key}'
+        }
+    
+    def _key_fingerprint(self) -> str:
+        """API密钥的哈希指纹，用于缓存键，避免在内存结构中保存明文密钥"""
+        return hashlib.sha256(self.api_key.encode('utf-8')).hexdigest()[:16]
     
     def _make_request(self, method: str, endpoint: str, data: Optional[Dict] = None, 
                      timeout: Optional[int] = None) -> Dict[str, Any]:
@@ -65,62 +307,121 @@ class FluxKontextAPI:
         Raises:
             FluxKontextAPIError: API调用失败
         """
-        url = f"{self.config.get_config('api_base_url')}{endpoint}"
+        router = get_router(self.config)
         timeout = timeout or self.config.get_config('timeout', 300)
-        max_retries = self.config.get_config('max_retries', 3)
+        # 配置了多个端点时，保证每个端点至少有一次尝试机会
+        max_retries = max(self.config.get_config('max_retries', 3), len(router))
+        tried = []
+        
+        def backoff(attempt: int):
+            # 还有未尝试的健康端点时立即切换，否则指数退避
+            if not router.has_alternative(tried):
+                time.sleep(2 ** attempt)
         
         for attempt in range(max_retries):
+            base_url = router.select(exclude=tried)
+            tried.append(base_url)
+            url = f"{base_url}{endpoint}"
+            started = time.monotonic()
             try:
                 if method.upper() == 'POST':
                     response = self.session.post(
                         url, 
                         json=data, 
+                        headers=self.headers,
                         timeout=timeout
                     )
                 else:
-                    response = self.session.get(url, timeout=timeout)
+                    response = self.session.get(url, headers=self.headers, timeout=timeout)
                 
-                # 检查HTTP状态码
-                if response.status_code == 200:
-                    return response.json()
-                elif response.status_code == 401:
-                    raise FluxKontextAPIError("API密钥无效或已过期")
-                elif response.status_code == 429:
-                    raise FluxKontextAPIError("请求频率过高，请稍后重试")
-                elif response.status_code >= 500:
-                    if attempt < max_retries - 1:
-                        time.sleep(2 ** attempt)  # 指数退避
-                        continue
-                    raise FluxKontextAPIError(f"服务器错误: {response.status_code}")
-                else:
+                # 检查HTTP状态码；无论结果如何都关闭响应，及时把连接归还连接池
+                with response:
+                    if response.status_code >= 500:
+                        router.record_failure(base_url)
+                        if attempt < max_retries - 1:
+                            backoff(attempt)
+                            continue
+                        raise FluxKontextAPIError(f"服务器错误: {response.status_code}")
+                    
+                    if response.status_code == 200:
+                        # 响应体能正常解析才说明端点健康；解析失败按端点故障处理
+                        result = response.json()
+                        router.record_success(base_url, time.monotonic() - started)
+                        return result
+
+                    error_data = None
                     error_msg = f"API请求失败: {response.status_code}"
                     try:
                         error_data = response.json()
                         if 'error' in error_data:
-                            error_msg += f" - {error_data['error']}"
+                            error_msg += f" - {_extract_error_message(error_data)}"
                     except:
                         pass
+
+                    if _is_rejection(response.status_code, error_data):
+                        # 内容审核、参数无效等是确定性的，重试也不会成功；端点本身应答正常，记录其延迟
+                        router.record_success(base_url, time.monotonic() - started)
+                        raise FluxKontextAPIRejectedError(error_msg, response.status_code)
+
+                    # 其余4xx可能只是当前端点的问题（路径不存在、防火墙拦截、限流等），切换端点重试
+                    router.record_failure(base_url)
+                    if response.status_code == 401:
+                        error_msg = "API密钥无效或已过期"
+                    elif response.status_code == 429:
+                        error_msg = "请求频率过高，请稍后重试"
+                    if attempt < max_retries - 1:
+                        backoff(attempt)
+                        continue
                     raise FluxKontextAPIError(error_msg)
                     
+            except FluxKontextAPIError:
+                raise
+                    
             except requests.exceptions.Timeout:
+                router.record_failure(base_url)
                 if attempt < max_retries - 1:
-                    time.sleep(2 ** attempt)
+                    backoff(attempt)
                     continue
                 raise FluxKontextAPIError("请求超时，请检查网络连接")
             except requests.exceptions.ConnectionError:
+                router.record_failure(base_url)
                 if attempt < max_retries - 1:
-                    time.sleep(2 ** attempt)
+                    backoff(attempt)
                     continue
                 raise FluxKontextAPIError("网络连接失败，请检查网络设置")
             except Exception as e:
+                # 响应损坏（JSON解析失败、分块传输中断等）同样说明该端点不可靠
+                router.record_failure(base_url)
                 if attempt < max_retries - 1:
-                    time.sleep(2 ** attempt)
+                    backoff(attempt)
                     continue
                 raise FluxKontextAPIError(format_error_message(e, "网络请求"))
         
         raise FluxKontextAPIError("达到最大重试次数，请求失败")
     
-    def generate_image(self, 
+    def generate_image(self, prompt: str, *args, **kwargs) -> Tuple[Any, str]:
+        """
+        生成图像（标准API）：依次提交请求、下载并解码结果图像
+        
+        参数与 build_payload 相同。
+        
+        Returns:
+            Tuple: (PIL图像, 图像URL)
+            
+        Raises:
+            FluxKontextAPIError: API调用失败
+        """
+        image_url = self.request_image_url(prompt, *args, **kwargs)
+        print("⬇️ 正在下载生成的图像...")
+        image_bytes = self.fetch_image_bytes(image_url)
+        try:
+            pil_image = decode_image(image_bytes)
+        except Exception as e:
+            raise FluxKontextAPIError(f"下载或处理图像时出错: {str(e)}")
+        print("✅ 图像生成并下载成功")
+        return pil_image, image_url
+
+    def build_payload(self, 
                       prompt: str,
                       model: str = "flux-kontext-pro",
                       seed: Optional[int] = None,
@@ -133,7 +434,7 @@ class FluxKontextAPI:
                       webhook_url: Optional[str] = None,
                       webhook_secret: Optional[str] = None) -> Dict[str, Any]:
         """
-        生成图像（标准API）
+        构建生成请求数据
         
         Args:
             prompt: 文本提示
@@ -149,12 +450,8 @@ class FluxKontextAPI:
             webhook_secret: Webhook密钥
             
         Returns:
-            Dict: API响应，包含图像URL等信息
-            
-        Raises:
-            FluxKontextAPIError: API调用失败
+            Dict: 请求数据
         """
-        # 构建请求数据
         payload = {
             "model": model,
             "prompt": prompt
@@ -178,7 +475,66 @@ class FluxKontextAPI:
             # 只有当值不是None，或者对于字符串，不是空字符串时，才添加到payload
             if value is not None and value != '':
                 payload[key] = value
+        return payload
+
+    def request_fingerprint(self, payload: Dict[str, Any]) -> str:
+        """
+        请求指纹：相同服务地址、密钥和完整参数的请求得到相同指纹，用于合并并发请求
+        
+        参考图以URL形式包含在提示词中，因此也参与指纹计算。
+        """
+        return make_fingerprint(self.config.get_api_base_urls(), self._key_fingerprint(), payload)
+
+    def rejection_fingerprint(self, payload: Dict[str, Any]) -> str:
+        """
+        负缓存指纹：与请求指纹相同但不含seed
+        
+        内容审核、参数无效等拒绝与种子无关。节点默认seed=0时每次运行都会随机取种子，
+        不含seed才能让重新运行以及同一批次的其他种子命中负缓存。
+        """
+        params = {key: value for key, value in payload.items() if key != "seed"}
+        return make_fingerprint(self.config.get_api_base_urls(), self._key_fingerprint(), params)
+
+    def request_image_url(self, prompt: str, *args, **kwargs) -> str:
+        """
+        提交生成请求并返回结果图像URL（不下载）
+        
+        参数与 build_payload 相同。API并发槽位只在这一步占用，下载和解码可以交给其他工作线程完成。
+            
+        Returns:
+            str: 结果图像URL
+            
+        Raises:
+            FluxKontextAPIError: API调用失败
+        """
+        note_activity(self.config)
+        payload = self.build_payload(prompt, *args, **kwargs)
+        rejection_key = self.rejection_fingerprint(payload)
+
+        # 近期被确定性拒绝过的相同请求（不论种子）直接失败，不再发送
+        cached_reason = _get_negative_cache(rejection_key)
+        if cached_reason is not None:
+            raise FluxKontextAPIRejectedError(f"{cached_reason}（近期相同请求已被拒绝）")
+
+        # 节点经由流水线提交时已在进入调度器之前按相同指纹合并（见 GenerationPipeline.submit）；
+        # 这里的合并只覆盖直接调用 generate_image / request_image_url 的调用方
+        try:
+            return get_flight("generation").do(self.request_fingerprint(payload), self._request_url, payload)
+        except FluxKontextAPIRejectedError as e:
+            if e.cacheable:
+                _put_negative_cache(rejection_key, str(e), self.config.get_config('negative_cache_ttl', 300))
+            raise
 
+    def _request_url(self, payload: Dict[str, Any]) -> str:
+        """
+        发送生成请求并提取结果图像URL
+        
+        Args:
+            payload: 请求数据
+            
+        Returns:
+            str: 结果图像URL
+        """
         # 发送请求
         try:
             response = self._make_request('POST', '/v1/images/generations', data=payload)
@@ -194,27 +550,80 @@ class FluxKontextAPI:
             image_url = response['data'][0]['url']
             if not isinstance(image_url, str) or not image_url.startswith('http'):
                  raise FluxKontextAPIError(f"API返回了无效的图片URL格式: {str(image_url)[:100]}")
-            
-            try:
-                # 下载图像
-                print("⬇️ 正在下载生成的图像...")
-                timeout = self.config.get_config('timeout', 60) # 提供一个默认值
-                pil_image = download_image(image_url, timeout=timeout)
-                if pil_image is None:
-                    # 这里的错误信息可以更具体
-                    raise FluxKontextAPIError("图像下载失败，可能是网络超时或服务异常")
-                
-                print("✅ 图像生成并下载成功")
-                # 直接返回PIL图像和URL，这是与之前最大的不同
-                return pil_image, image_url
-
-            except Exception as e:
-                raise FluxKontextAPIError(f"下载或处理图像时出错: {str(e)}")
+            return image_url
         else:
             # 如果响应中没有预期的图像数据，则尝试解析并抛出详细的错误信息
-            error_message = response.get("error", {}).get("message", "API返回未知格式的响应")
-            raise FluxKontextAPIError(f"API错误: {error_message} | 原始响应: {str(response)[:200]}")
+            if response.get("error"):
+                # 只有错误类型明确为内容审核或参数无效时才是确定性拒绝，超时、过载等按普通错误处理
+                if _is_rejection(None, response):
+                    raise FluxKontextAPIRejectedError(f"API错误: {_extract_error_message(response)}")
+                raise FluxKontextAPIError(f"API错误: {_extract_error_message(response)}")
+            raise FluxKontextAPIError(f"API错误: API返回未知格式的响应 | 原始响应: {str(response)[:200]}")
+
+    def fetch_image_bytes(self, image_url: str) -> bytes:
+        """
+        下载结果图像的原始字节，复用共享连接池
+        
+        同一URL的并发下载只执行一次。
+        
+        Args:
+            image_url: 图像URL
+            
+        Returns:
+            bytes: 图像文件内容
+            
+        Raises:
+            FluxKontextAPIError: 下载失败
+        """
+        timeout = self.config.get_config('timeout', 60) # 提供一个默认值
+        try:
+            data = get_flight("download").do(image_url, fetch_image_bytes, image_url,
+                                             timeout=timeout, session=self.session)
+        except Exception as e:
+            print(f"图像下载失败，错误: {str(e)}")
+            raise FluxKontextAPIError("图像下载失败，可能是网络超时或服务异常")
+        _remember_origin(image_url)
+        return data
     
+    def check_health(self, force: bool = False) -> bool:
+        """
+        轻量级健康检查
+        
+        请求一个带认证的轻量端点（默认 /v1/models），不会产生付费生成。
+        结果按 health_check_ttl 缓存，TTL内的重复检查直接返回缓存结果。
+        
+        Args:
+            force: 是否忽略缓存强制检查
+            
+        Returns:
+            bool: API是否可达且密钥有效
+        """
+        # 检查当前会被选中的端点
+        base_url = get_router(self.config).select()
+        cache_key = (base_url, self._key_fingerprint())
+        ttl = self.config.get_config('health_check_ttl', 60)
+
+        if not force:
+            with _health_cache_lock:
+                cached = _health_cache.get(cache_key)
+            if cached is not None and time.monotonic() - cached[0] < ttl:
+                return cached[1]
+
+        url = f"{base_url}{self.config.get_config('health_check_endpoint', '/v1/models')}"
+        timeout = self.config.get_config('health_check_timeout', 10)
+        try:
+            response = self.session.get(url, headers=self.headers, timeout=timeout)
+            # 401/403说明密钥无效，5xx说明服务异常；其余状态码说明服务可达
+            healthy = response.status_code < 500 and response.status_code not in (401, 403)
+            response.close()
+        except requests.exceptions.RequestException:
+            get_router(self.config).record_failure(base_url)
+            healthy = False
+
+        with _health_cache_lock:
+            _health_cache[cache_key] = (time.monotonic(), healthy)
+        return healthy
+
     def test_connection(self) -> bool:
         """
         测试API连接
@@ -223,9 +632,7 @@ class FluxKontextAPI:
             bool: 连接是否成功
         """
         try:
-            # 尝试一个简单的请求来测试连接
-            self.generate_image("test", seed=1)
-            return True
+            return self.check_health()
         except:
             return False
     
@@ -238,7 +645,8 @@ class FluxKontextAPI:
         """
         status = {
             "api_key_valid": self.config.is_api_key_valid(),
-            "base_url": self.config.get_config('api_base_url'),
+            "base_url": get_router(self.config).select(),
+            "endpoints": get_router(self.config).get_status(),
             "model": self.config.get_config('model'),
             "timeout": self.config.get_config('timeout'),
             "max_retries": self.config.get_config('max_retries')
@@ -250,4 +658,13 @@ class FluxKontextAPI:
         except:
             status["connection_ok"] = False
         
+        # 并发请求合并统计："pipeline" 为节点提交时的合并，"generation" 只统计直接调用API客户端的请求
+        pipeline = get_pipeline()
+        status["coalesce"] = get_coalesce_metrics()
+        status["coalesce"]["pipeline"] = pipeline.get_coalesce_metrics()
+        
+        # 全局调度器的队列深度和各流水线阶段的当前状态
+        status["scheduler"] = get_scheduler().get_metrics()
+        status["pipeline"] = pipeline.get_metrics()
+        
         return status 
\ No newline at end of file
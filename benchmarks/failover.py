@@ -0,0 +1,99 @@
+"""
+多端点故障切换基准测试
+启动多个本地模拟服务器，分别注入不同的延迟和失败率，验证请求会被路由到最快的健康端点，
+并在该端点中途故障时自动切换。
+
+用法:
+    python benchmarks/failover.py --requests 200
+"""
+
+import argparse
+import contextlib
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PLUGIN_DIR)
+
+from mock_server import MockServer, MockState
+
+def percentile(values, p: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return float("nan")
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+def run_phase(name: str, client, servers, count: int, parallel: int) -> bool:
+    """执行一轮请求并打印各端点承担的请求数和延迟分布"""
+    before = [server.state.counts["generations"] for server in servers]
+    latencies, failures = [], 0
+
+    def one(i: int):
+        started = time.perf_counter()
+        try:
+            client.generate_image(f"failover benchmark {name} {i}", seed=i + 1)
+            return time.perf_counter() - started, None
+        except Exception as e:
+            return time.perf_counter() - started, e
+
+    # 客户端内部有进度输出，测试期间丢弃
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull), \
+            ThreadPoolExecutor(max_workers=parallel) as executor:
+        for latency, error in executor.map(one, range(count)):
+            latencies.append(latency)
+            failures += error is not None
+
+    print(f"\n[{name}] {count} 次请求，失败 {failures} 次，"
+          f"p50 {percentile(latencies, 0.5) * 1000:.0f}ms，p95 {percentile(latencies, 0.95) * 1000:.0f}ms")
+    for server, start in zip(servers, before):
+        state = server.state
+        print(f"  {server.base_url}  延迟 {state.latency * 1000:5.0f}ms  失败率 {state.failure_rate:4.0%}  "
+              f"承担请求 {state.counts['generations'] - start}")
+    return failures == 0
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="多端点故障切换基准测试")
+    parser.add_argument("--requests", type=int, default=200, help="每轮请求数")
+    parser.add_argument("--parallel", type=int, default=4, help="并发请求数")
+    parser.add_argument("--latencies", type=str, default="0.15,0.03,0.08", help="各端点注入延迟（秒），逗号分隔")
+    args = parser.parse_args()
+
+    latencies = [float(v) for v in args.latencies.split(",")]
+    servers = [MockServer(MockState(latency=latency, image_size=(64, 64))).start() for latency in latencies]
+
+    os.environ["TUZI_API_KEY"] = "failover-benchmark-key"
+    from config import default_config
+    from endpoints import get_router
+    default_config.set_config("api_base_urls", [server.base_url for server in servers])
+    default_config.set_config("endpoint_cooldown", 5)
+    default_config.set_config("prewarm_on_load", False)
+
+    import api_client
+    client = api_client.FluxKontextAPI(os.environ["TUZI_API_KEY"])
+    router = get_router(default_config)
+
+    ok = run_phase("预热与延迟学习", client, servers, args.requests, args.parallel)
+
+    fastest = min(servers, key=lambda server: server.state.latency)
+    fastest.state.failure_rate = 1.0
+    ok = run_phase(f"最快端点故障 ({fastest.base_url})", client, servers, args.requests, args.parallel) and ok
+
+    fastest.state.failure_rate = 0.0
+    time.sleep(default_config.get_config("endpoint_cooldown") + 0.5)
+    ok = run_phase("故障恢复", client, servers, args.requests, args.parallel) and ok
+
+    print("\n端点状态:")
+    for status in router.get_status():
+        latency = f"{status['latency_ms']:.0f}ms" if status["latency_ms"] is not None else "-"
+        print(f"  {status['url']}  健康 {status['healthy']}  平均延迟 {latency}  "
+              f"成功 {status['successes']}  失败 {status['failures']}")
+
+    for server in servers:
+        server.stop()
+    print("\n✅ 所有请求均成功" if ok else "\n❌ 存在失败的请求")
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,166 @@
+"""
+本地模拟服务器
+模拟兔子AI的图像生成接口、结果图像CDN和参考图上传接口，供基准测试和浸泡测试使用。
+支持按服务器注入延迟和失败，便于在本地复现网络异常。
+"""
+
+import io
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+from PIL import Image
+
+class MockState:
+    """单个模拟服务器的可调参数和计数"""
+
+    def __init__(self, latency: float = 0.0, failure_rate: float = 0.0, failure_status: int = 500,
+                 image_size: tuple = (512, 512), reject_prompts: Optional[list] = None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self.reject_prompts = list(reject_prompts or [])
+        self.lock = threading.Lock()
+        self.counts = {"generations": 0, "failures": 0, "rejections": 0, "downloads": 0, "uploads": 0}
+        self.set_image_size(image_size)
+
+    def set_image_size(self, image_size: tuple):
+        """设置返回的结果图像尺寸 (宽, 高)"""
+        buffer = io.BytesIO()
+        # 使用随机噪声，避免PNG压缩后过小而失去代表性
+        noise = Image.effect_noise(image_size, 64).convert("RGB")
+        noise.save(buffer, "PNG")
+        self.image_bytes = buffer.getvalue()
+
+    def count(self, name: str):
+        with self.lock:
+            self.counts[name] += 1
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # 响应头和响应体分开写出，关闭Nagle算法避免keep-alive下的延迟确认等待
+    disable_nagle_algorithm = True
+
+    @property
+    def state(self) -> MockState:
+        return self.server.state
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str = "application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get("Content-Length", 0))
+        return self.rfile.read(length) if length else b""
+
+    def _base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def do_HEAD(self):
+        self._send(200, b"")
+
+    def do_GET(self):
+        if self.path.startswith("/v1/models"):
+            self._send(200, json.dumps({"data": [{"id": "flux-kontext-pro"}]}).encode("utf-8"))
+        elif self.path.startswith("/images/") or self.path.startswith("/uploads/"):
+            self.state.count("downloads")
+            self._send(200, self.state.image_bytes, "image/png")
+        else:
+            self._send(404, b'{"error": "not found"}')
+
+    def do_POST(self):
+        body = self._read_body()
+        if self.path.startswith("/v1/images/generations"):
+            self._handle_generation(body)
+        elif self.path.startswith("/upload"):
+            self.state.count("uploads")
+            name = f"{random.getrandbits(64):016x}.png"
+            self._send(200, json.dumps({"url": f"{self._base_url()}/uploads/{name}"}).encode("utf-8"))
+        else:
+            self._send(404, b'{"error": "not found"}')
+
+    def _handle_generation(self, body: bytes):
+        state = self.state
+        state.count("generations")
+        if state.latency > 0:
+            time.sleep(state.latency)
+
+        payload = json.loads(body or b"{}")
+        prompt = payload.get("prompt", "")
+        if any(word in prompt for word in state.reject_prompts):
+            state.count("rejections")
+            error = {"error": {"message": "Content moderated", "type": "content_policy_violation"}}
+            self._send(400, json.dumps(error).encode("utf-8"))
+            return
+
+        if state.failure_rate > 0 and random.random() < state.failure_rate:
+            state.count("failures")
+            self._send(state.failure_status, b'{"error": "injected failure"}')
+            return
+
+        name = f"{random.getrandbits(64):016x}.png"
+        response = {"data": [{"url": f"{self._base_url()}/images/{name}"}]}
+        self._send(200, json.dumps(response).encode("utf-8"))
+
+class MockServer:
+    """在后台线程中运行的模拟服务器"""
+
+    def __init__(self, state: Optional[MockState] = None, host: str = "127.0.0.1", port: int = 0):
+        self.state = state or MockState()
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.state = self.state
+        self._thread = threading.Thread(target=self._server.serve_forever, name="MockServer", daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockServer":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+class MockFalClient:
+    """
+    fal_client 的本地替身，把参考图上传到模拟服务器
+
+    仅供基准测试使用，接口与节点用到的 fal_client.upload_file 一致。
+    """
+
+    def __init__(self, base_url: str):
+        import requests
+        self._base_url = base_url
+        self._session = requests.Session()
+
+    def upload_file(self, path: str) -> str:
+        with open(path, "rb") as f:
+            data = f.read()
+        with self._session.post(f"{self._base_url}/upload", data=data, timeout=30) as response:
+            response.raise_for_status()
+            return response.json()["url"]
+
+    def close(self):
+        self._session.close()
@@ -0,0 +1,103 @@
+"""
+输出内存基准测试
+对比不同批量大小下，结果图像从解码到构建输出张量过程中的内存峰值：
+- legacy: 旧实现（保留全部PIL图像和float32副本后再torch.cat），仅作对比
+- standard: 当前的pil_to_tensor（预分配输出张量，逐张写入）
+- memory_bounded: 解码后立即写入FrameSpillBuffer并释放图像，最后按内存预算分块构建
+
+每个组合在独立子进程中运行，使用ru_maxrss测量峰值。
+
+用法:
+    python benchmarks/output_memory.py --batch-sizes 8,16,32,64 --size 1024
+"""
+
+import argparse
+import io
+import os
+import resource
+import subprocess
+import sys
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PLUGIN_DIR)
+
+MODES = ["legacy", "standard", "memory_bounded"]
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux以KB为单位，macOS以字节为单位
+    return peak / 1024 if sys.platform != "darwin" else peak / (1024 * 1024)
+
+def run_worker(mode: str, batch: int, size: int, budget_mb: float):
+    """在当前进程中执行一次转换并输出 峰值增长MB 和 输出张量MB"""
+    import numpy as np
+    import torch
+    from PIL import Image
+    from utils import FrameSpillBuffer, pil_to_tensor
+
+    buffer = io.BytesIO()
+    Image.effect_noise((size, size), 64).convert("RGB").save(buffer, "PNG")
+    png_bytes = buffer.getvalue()
+    del buffer
+
+    def decode():
+        # 模拟下载后的解码：每张结果都是独立的PIL图像
+        image = Image.open(io.BytesIO(png_bytes))
+        image.load()
+        return image
+
+    baseline = _peak_rss_mb()
+    if mode == "legacy":
+        images = [decode() for _ in range(batch)]
+        tensors = [torch.from_numpy(np.array(img).astype(np.float32) / 255.0)[None,] for img in images]
+        output = torch.cat(tensors, dim=0)
+    elif mode == "standard":
+        images = [decode() for _ in range(batch)]
+        output = pil_to_tensor(images)
+    else:
+        with FrameSpillBuffer(batch, memory_budget_mb=budget_mb) as spill:
+            for _ in range(batch):
+                spill.append(decode())
+            output = spill.to_tensor()
+
+    output_mb = output.numel() * output.element_size() / (1024 * 1024)
+    print(f"{_peak_rss_mb() - baseline:.1f} {output_mb:.1f}")
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="输出内存基准测试")
+    parser.add_argument("--batch-sizes", type=str, default="8,16,32,64", help="批量大小，逗号分隔")
+    parser.add_argument("--size", type=int, default=1024, help="结果图像边长（像素）")
+    parser.add_argument("--budget-mb", type=float, default=64, help="memory_bounded模式的读取缓冲区预算（MB）")
+    parser.add_argument("--modes", type=str, default=",".join(MODES), help="要测试的模式，逗号分隔")
+    parser.add_argument("--worker", nargs=2, metavar=("MODE", "BATCH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker[0], int(args.worker[1]), args.size, args.budget_mb)
+        return 0
+
+    modes = [mode for mode in args.modes.split(",") if mode in MODES]
+    print(f"图像尺寸 {args.size}x{args.size}，memory_bounded读取预算 {args.budget_mb}MB")
+    print(f"{'批量':>6} | {'输出张量MB':>10} | " + " | ".join(f"{mode + ' 峰值MB':>20}" for mode in modes))
+
+    for batch in [int(v) for v in args.batch_sizes.split(",")]:
+        peaks, output_mb = [], None
+        for mode in modes:
+            result = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--worker", mode, str(batch),
+                 "--size", str(args.size), "--budget-mb", str(args.budget_mb)],
+                capture_output=True, text=True
+            )
+            if result.returncode != 0:
+                peaks.append("失败")
+                continue
+            peak, output_mb = result.stdout.strip().splitlines()[-1].split()
+            peaks.append(f"{float(peak):.0f}")
+        output_text = f"{float(output_mb):.0f}" if output_mb else "-"
+        print(f"{batch:>6} | {output_text:>10} | " + " | ".join(f"{peak:>20}" for peak in peaks))
+
+    print("\n峰值MB为转换过程中进程常驻内存峰值的增长量（包含输出张量本身）")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,60 @@
+"""
+确定性拒绝快速失败检查
+模拟服务器对包含指定关键词的提示词返回内容审核错误，按节点默认设置（seed=0，每次随机取种子）
+重复运行文生图节点，检查首次被拒绝后，重新运行不再向服务器发送任何生成请求。
+
+用法:
+    python benchmarks/rejections.py --runs 3 --num-images 4
+"""
+
+import argparse
+import contextlib
+import os
+import sys
+import time
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PLUGIN_DIR)
+
+from mock_server import MockServer, MockState
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="确定性拒绝快速失败检查")
+    parser.add_argument("--runs", type=int, default=3, help="重复运行次数")
+    parser.add_argument("--num-images", type=int, default=4, help="每次运行的图像数量")
+    parser.add_argument("--latency", type=float, default=0.2, help="模拟服务器的生成延迟（秒）")
+    args = parser.parse_args()
+
+    server = MockServer(MockState(latency=args.latency, image_size=(64, 64), reject_prompts=["BAD"])).start()
+
+    os.environ["TUZI_API_KEY"] = "rejection-check-key"
+    from config import default_config
+    default_config.set_config("api_base_urls", [server.base_url])
+    default_config.set_config("prewarm_on_load", False)
+
+    import nodes
+    node = nodes.FluxKontext_TextToImage()
+    params = dict(prompt="BAD thing", model="flux-kontext-pro", num_images=args.num_images, seed=0,
+                  guidance_scale=3.5, num_inference_steps=28, aspect_ratio="1:1", output_format="png",
+                  safety_tolerance=3, prompt_upsampling=False)
+
+    ok = True
+    for run in range(1, args.runs + 1):
+        before = server.state.counts["generations"]
+        started = time.perf_counter()
+        # 节点内部有进度输出，检查期间丢弃
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            result = node.execute(**params)
+        elapsed = (time.perf_counter() - started) * 1000
+        sent = server.state.counts["generations"] - before
+        print(f"第{run}次运行: 发送生成请求 {sent} 次，耗时 {elapsed:.0f}ms | {result['result'][1].splitlines()[-1]}")
+        # 首次运行的种子可能已同时在执行；之后的运行必须全部命中负缓存
+        if run > 1 and sent:
+            ok = False
+
+    server.stop()
+    print("\n✅ 重新运行未发送任何请求" if ok else "\n❌ 重新运行仍在发送请求")
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
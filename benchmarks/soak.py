@@ -0,0 +1,218 @@
+"""
+浸泡测试（资源泄漏检测）
+对本地模拟服务器连续执行数千次节点调用，周期性记录RSS、tracemalloc、
+打开的文件描述符、socket数量和线程数，预热后的增长超过阈值即判定失败。
+
+用法:
+    python benchmarks/soak.py --iterations 2000 --parallel 2
+"""
+
+import argparse
+import contextlib
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PLUGIN_DIR)
+
+from mock_server import MockFalClient, MockServer, MockState
+
+def _rss_mb() -> float:
+    """当前进程的常驻内存（MB）"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    except ImportError:
+        return float("nan")
+
+def _fd_counts() -> tuple:
+    """(打开的文件描述符数, 其中的socket数)"""
+    fd_dir = "/proc/self/fd"
+    if os.path.isdir(fd_dir):
+        fds = sockets = 0
+        for name in os.listdir(fd_dir):
+            try:
+                target = os.readlink(os.path.join(fd_dir, name))
+            except OSError:
+                continue
+            fds += 1
+            if target.startswith("socket:"):
+                sockets += 1
+        return fds, sockets
+    try:
+        import psutil
+        process = psutil.Process()
+        return process.num_fds(), len(process.net_connections())
+    except (ImportError, AttributeError):
+        return -1, -1
+
+def sample(iteration: int) -> dict:
+    """采集一次资源使用快照"""
+    fds, sockets = _fd_counts()
+    traced, _ = tracemalloc.get_traced_memory()
+    return {
+        "iteration": iteration,
+        "rss_mb": _rss_mb(),
+        "traced_mb": traced / (1024 * 1024),
+        "fds": fds,
+        "sockets": sockets,
+        "threads": threading.active_count(),
+    }
+
+def format_sample(s: dict) -> str:
+    return (f"#{s['iteration']:>6} | RSS {s['rss_mb']:8.1f} MB | traced {s['traced_mb']:7.2f} MB | "
+            f"fds {s['fds']:4} | sockets {s['sockets']:4} | threads {s['threads']:3}")
+
+def build_workload(nodes, args):
+    """构造节点调用列表：文生图、单图编辑、多图编辑（分别上传/拼接）交替执行"""
+    import torch
+
+    common = {
+        "prompt": "soak test prompt",
+        "model": "flux-kontext-pro",
+        "num_images": args.num_images,
+        "seed": 0,
+        "guidance_scale": 3.5,
+        "num_inference_steps": 28,
+        "aspect_ratio": "1:1",
+        "output_format": "png",
+        "safety_tolerance": 2,
+        "prompt_upsampling": False,
+    }
+
+    def reference():
+        return torch.rand(1, args.reference_size, args.reference_size, 3)
+
+    text_node = nodes.FluxKontext_TextToImage()
+    edit_node = nodes.FluxKontext_ImageToImage()
+    multi_node = nodes.FluxKontext_MultiImageToImage()
+
+    return [
+        lambda: text_node.execute(**dict(common)),
+        lambda: edit_node.execute(image=reference(), **dict(common)),
+        lambda: multi_node.execute(image_1=reference(), image_2=reference(), **dict(common)),
+        lambda: multi_node.execute(image_1=reference(), image_2=reference(), reference_mode="composite", **dict(common)),
+    ]
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Flux-Kontext节点浸泡测试")
+    parser.add_argument("--iterations", type=int, default=2000, help="节点执行总次数")
+    parser.add_argument("--parallel", type=int, default=2, help="同时执行的节点数")
+    parser.add_argument("--num-images", type=int, default=2, help="每次执行生成的图像数")
+    parser.add_argument("--image-size", type=int, default=256, help="模拟结果图像边长")
+    parser.add_argument("--reference-size", type=int, default=128, help="参考图像边长")
+    parser.add_argument("--latency", type=float, default=0.0, help="模拟生成接口延迟（秒）")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="模拟生成接口失败率")
+    parser.add_argument("--warmup", type=int, default=100, help="预热执行次数，之后的快照作为基线")
+    parser.add_argument("--sample-every", type=int, default=200, help="采样间隔（执行次数）")
+    parser.add_argument("--max-rss-growth-mb", type=float, default=64.0)
+    parser.add_argument("--max-traced-growth-mb", type=float, default=16.0)
+    parser.add_argument("--max-fd-growth", type=int, default=8)
+    parser.add_argument("--max-socket-growth", type=int, default=8)
+    parser.add_argument("--max-thread-growth", type=int, default=4)
+    args = parser.parse_args()
+
+    state = MockState(latency=args.latency, failure_rate=args.failure_rate,
+                      image_size=(args.image_size, args.image_size))
+    server = MockServer(state).start()
+
+    # 在导入节点前完成配置，使预热和所有请求都指向模拟服务器
+    os.environ["TUZI_API_KEY"] = "soak-test-key"
+    from config import default_config
+    default_config.set_config("api_base_url", server.base_url)
+    default_config.set_config("max_retries", 1)
+
+    import nodes
+    fal = MockFalClient(server.base_url)
+    nodes.fal_client = fal
+
+    workload = build_workload(nodes, args)
+    failures = 0
+    failures_lock = threading.Lock()
+
+    def run_one(i: int):
+        nonlocal failures
+        result = random.Random(i).choice(workload)()
+        if result["result"][1].startswith("失败"):
+            with failures_lock:
+                failures += 1
+
+    tracemalloc.start(10)
+    samples = []
+    baseline = None
+    baseline_snapshot = None
+    started = time.perf_counter()
+
+    print(format_sample(sample(0)))
+    with open(os.devnull, "w") as devnull, ThreadPoolExecutor(max_workers=args.parallel) as executor:
+        done = 0
+        while done < args.iterations:
+            chunk = min(args.sample_every, args.iterations - done)
+            if done < args.warmup:
+                chunk = min(chunk, args.warmup - done)
+            # 节点内部有大量进度输出，浸泡期间丢弃
+            with contextlib.redirect_stdout(devnull):
+                list(executor.map(run_one, range(done, done + chunk)))
+            done += chunk
+
+            current = sample(done)
+            samples.append(current)
+            print(format_sample(current))
+            if baseline is None and done >= args.warmup:
+                baseline = current
+                baseline_snapshot = tracemalloc.take_snapshot()
+
+    elapsed = time.perf_counter() - started
+    final = samples[-1]
+    final_snapshot = tracemalloc.take_snapshot()
+    fal.close()
+    server.stop()
+
+    baseline = baseline or samples[0]
+    growth = {
+        "rss_mb": final["rss_mb"] - baseline["rss_mb"],
+        "traced_mb": final["traced_mb"] - baseline["traced_mb"],
+        "fds": final["fds"] - baseline["fds"],
+        "sockets": final["sockets"] - baseline["sockets"],
+        "threads": final["threads"] - baseline["threads"],
+    }
+    limits = {
+        "rss_mb": args.max_rss_growth_mb,
+        "traced_mb": args.max_traced_growth_mb,
+        "fds": args.max_fd_growth,
+        "sockets": args.max_socket_growth,
+        "threads": args.max_thread_growth,
+    }
+
+    print(f"\n{args.iterations} 次执行，耗时 {elapsed:.1f}s，失败 {failures} 次，服务器计数 {state.counts}")
+    print(f"基线（第 {baseline['iteration']} 次执行后）至结束的增长:")
+    exceeded = []
+    for name, value in growth.items():
+        flag = "超出阈值" if value > limits[name] else "正常"
+        print(f"  {name:10} {value:+10.2f}  (阈值 {limits[name]})  {flag}")
+        if value > limits[name]:
+            exceeded.append(name)
+
+    if baseline_snapshot is not None:
+        print("\ntracemalloc 增长最多的分配位置:")
+        for stat in final_snapshot.compare_to(baseline_snapshot, "lineno")[:10]:
+            print(f"  {stat}")
+
+    if exceeded:
+        print(f"\n❌ 检测到资源增长超过阈值: {', '.join(exceeded)}")
+        return 1
+    print("\n✅ 未检测到资源泄漏")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,7 +4,7 @@
 """
 
 import os
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple
 from pathlib import Path
 
 # 尝试导入dotenv，如果失败则优雅降级
@@ -26,13 +26,54 @@ class FluxKontextConfig:
     # 默认配置
     DEFAULT_CONFIG = {
         "api_base_url": "https://api.tu-zi.com",
+        # 多端点（镜像/区域节点）：为空时只使用api_base_url
+        "api_base_urls": [],
+        "endpoint_failure_threshold": 2,
+        "endpoint_cooldown": 30,
         "model": "flux-kontext-pro",
         "aspect_ratio": "1:1",
         "output_format": "jpeg",
         "safety_tolerance": 2,
         "prompt_upsampling": False,
         "timeout": 300,
-        "max_retries": 3
+        "max_retries": 3,
+        # 内容审核、参数无效等确定性拒绝的缓存时间（秒），期间相同请求直接失败
+        "negative_cache_ttl": 300,
+        # 全局调度：所有节点共享的API并发上限
+        "max_concurrency": 4,
+        # 分阶段流水线：API槽位拿到图像URL后立即释放，下载和解码使用独立的有界工作池
+        "download_workers": 8,
+        "decode_workers": 2,
+        "pipeline_queue_size": 64,
+        # 异步提交的任务超过该时间（秒）未被收集将被取消
+        "job_ttl": 3600,
+        # 输出模式：standard 在内存中转换结果；memory_bounded 先将解码后的帧写入磁盘缓冲区，
+        # 再按 output_memory_budget_mb 分块构建输出张量，适合超大批量
+        "output_mode": "standard",
+        "output_memory_budget_mb": 256,
+        # 连接池与健康检查
+        "pool_maxsize": 16,
+        "health_check_endpoint": "/v1/models",
+        "health_check_timeout": 10,
+        "health_check_ttl": 60,
+        # 连接预热：节点加载时提前建立到API/CDN的DNS、TCP和TLS连接
+        "prewarm_on_load": True,
+        # 生成结果和参考图托管在FAL的CDN上，加载时一并预热
+        "prewarm_hosts": ["https://v3.fal.media"],
+        # 周期性重新预热的间隔（秒），需小于服务器常见的keep-alive超时（60秒左右），
+        # 使空闲一段时间后连接池中仍有可用连接；0表示只在加载时预热一次
+        "prewarm_interval": 45,
+        # 距上次生成超过该时间（秒）后停止周期性预热，下次生成时自动恢复；0表示不停止
+        "prewarm_idle_timeout": 1800
+    }
+    
+    # 可通过环境变量（或.env文件）覆盖的配置项: 环境变量 -> (配置项, 类型)
+    ENV_OVERRIDES = {
+        "TUZI_PREWARM": ("prewarm_on_load", bool),
+        "TUZI_PREWARM_INTERVAL": ("prewarm_interval", float),
+        "TUZI_PREWARM_IDLE_TIMEOUT": ("prewarm_idle_timeout", float),
+        "TUZI_OUTPUT_MODE": ("output_mode", str),
+        "TUZI_OUTPUT_MEMORY_BUDGET_MB": ("output_memory_budget_mb", float),
     }
     
     # 支持的宽高比
@@ -40,16 +81,46 @@ class FluxKontextConfig:
         "21:9", "16:9", "4:3", "1:1", "3:4", "9:16", "9:21"
     ]
     
+    # 支持的调度优先级
+    SUPPORTED_PRIORITIES = ["interactive", "batch"]
+    
+    # 多图参考的处理方式：分别上传，或在本地拼接成一张后上传
+    SUPPORTED_REFERENCE_MODES = ["separate", "composite"]
+    SUPPORTED_COMPOSITE_LAYOUTS = ["horizontal", "vertical", "grid"]
+    
     # 支持的输出格式
     SUPPORTED_OUTPUT_FORMATS = ["jpeg", "png"]
     
+    # 支持的输出模式
+    SUPPORTED_OUTPUT_MODES = ["standard", "memory_bounded"]
+    
     def __init__(self):
         """
         初始化配置。API密钥将通过get_api_key()方法动态获取。
         """
         self.config = self.DEFAULT_CONFIG.copy()
+        self._apply_env_overrides()
         self.api_key_error_message = self._create_api_key_error_message()
 
+    def _apply_env_overrides(self):
+        """用ENV_OVERRIDES中已设置的环境变量覆盖默认配置，无效的值会被忽略"""
+        for env_name, (key, value_type) in self.ENV_OVERRIDES.items():
+            raw = os.getenv(env_name)
+            if raw is None or not raw.strip():
+                continue
+            raw = raw.strip()
+            try:
+                if value_type is bool:
+                    value = raw.lower() not in ("0", "false", "no", "off")
+                else:
+                    value = value_type(raw)
+                if key == "output_mode" and value not in self.SUPPORTED_OUTPUT_MODES:
+                    raise ValueError(value)
+            except ValueError:
+                print(f"环境变量 {env_name} 的值无效，已忽略: {raw}")
+                continue
+            self.config[key] = value
+
     def _create_api_key_error_message(self) -> str:
         """创建当API密钥未找到时的详细错误消息"""
         module_dir = Path(__file__).parent.resolve()
@@ -80,6 +151,10 @@ class FluxKontextConfig:
             return api_key.strip()
         return None
     
+    def is_api_key_valid(self) -> bool:
+        """检查是否已配置API密钥"""
+        return self.get_api_key() is not None
+    
     def get_fal_key(self) -> Optional[str]:
         """获取内置的FAL_KEY（用户无需配置）"""
         # 请珍惜开源项目，乱用这个fal 密钥的人，祝你孤独终老。
@@ -90,6 +165,35 @@ class FluxKontextConfig:
         """获取配置项"""
         return self.config.get(key, default)
     
+    def get_api_base_urls(self) -> List[Tuple[str, float]]:
+        """
+        获取API端点列表 [(基础地址, 权重), ...]
+        
+        优先使用配置项api_base_urls，其次是环境变量TUZI_API_BASE_URLS
+        （逗号分隔，可用 "地址|权重" 指定权重），都未设置时只使用api_base_url。
+        """
+        entries = self.get_config('api_base_urls') or []
+        if not entries:
+            env_value = os.getenv("TUZI_API_BASE_URLS", "")
+            entries = [item.strip() for item in env_value.split(',') if item.strip()]
+        
+        endpoints = []
+        for entry in entries:
+            if isinstance(entry, dict):
+                url, weight = entry.get('url'), entry.get('weight', 1.0)
+            elif isinstance(entry, (list, tuple)):
+                url, weight = entry[0], entry[1] if len(entry) > 1 else 1.0
+            else:
+                url, _, weight = str(entry).partition('|')
+            try:
+                weight = float(weight) if weight not in (None, '') else 1.0
+            except ValueError:
+                weight = 1.0
+            if url and url.strip():
+                endpoints.append((url.strip().rstrip('/'), weight))
+        
+        return endpoints or [(self.get_config('api_base_url').rstrip('/'), 1.0)]
+    
     def set_config(self, key: str, value: Any):
         """设置配置项"""
         self.config[key] = value
@@ -0,0 +1,170 @@
+"""
+多端点路由
+在多个API基础地址（镜像或区域节点）之间按被动观测到的延迟和错误选择最快的健康端点，
+并在请求失败时自动切换到其他端点。
+"""
+
+import random
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+try:
+    from .config import FluxKontextConfig, default_config
+except ImportError:
+    from config import FluxKontextConfig, default_config
+
+class _EndpointState:
+    """单个端点的被动健康状态"""
+
+    __slots__ = ("url", "weight", "order", "latency", "consecutive_failures",
+                 "unhealthy_until", "successes", "failures")
+
+    def __init__(self, url: str, weight: float, order: int):
+        self.url = url
+        self.weight = weight
+        self.order = order
+        self.latency: Optional[float] = None  # 指数加权平均延迟（秒）
+        self.consecutive_failures = 0
+        self.unhealthy_until = 0.0
+        self.successes = 0
+        self.failures = 0
+
+    def is_healthy(self, now: float) -> bool:
+        return now >= self.unhealthy_until
+
+    def score(self) -> Tuple[float, int]:
+        """排序键：加权延迟越小越优先；尚无延迟数据的端点按配置顺序排在后面"""
+        latency = self.latency if self.latency is not None else float("inf")
+        return (latency / self.weight, self.order)
+
+class EndpointRouter:
+    """
+    端点路由器
+
+    - 每次请求完成后记录延迟（指数加权平均）或失败
+    - 连续失败达到阈值的端点进入冷却期，冷却结束后重新参与选择
+    - 按 延迟/权重 选择最快的健康端点，并以小概率探测其他端点以更新延迟数据
+    """
+
+    def __init__(self, endpoints: List[Tuple[str, float]], ewma_alpha: float = 0.3,
+                 failure_threshold: int = 2, cooldown: float = 30.0, explore_ratio: float = 0.05):
+        """
+        初始化路由器
+
+        Args:
+            endpoints: [(基础地址, 权重), ...]，列表顺序即无延迟数据时的优先顺序
+            ewma_alpha: 延迟平滑系数
+            failure_threshold: 进入冷却所需的连续失败次数
+            cooldown: 冷却时间（秒）
+            explore_ratio: 探测非最优端点的概率
+        """
+        if not endpoints:
+            raise ValueError("至少需要一个API端点")
+        self._lock = threading.Lock()
+        self._states = [
+            _EndpointState(url.rstrip('/'), max(float(weight), 0.01), order)
+            for order, (url, weight) in enumerate(endpoints)
+        ]
+        self._by_url = {state.url: state for state in self._states}
+        self.ewma_alpha = ewma_alpha
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.cooldown = cooldown
+        self.explore_ratio = explore_ratio
+
+    @property
+    def urls(self) -> List[str]:
+        return [state.url for state in self._states]
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    def select(self, exclude: Iterable[str] = ()) -> str:
+        """
+        选择一个端点
+
+        Args:
+            exclude: 本次请求已经尝试过的端点，尽量避开
+
+        Returns:
+            str: 端点基础地址
+        """
+        excluded = set(exclude)
+        now = time.monotonic()
+        with self._lock:
+            candidates = [s for s in self._states if s.is_healthy(now) and s.url not in excluded]
+            if not candidates:
+                candidates = [s for s in self._states if s.is_healthy(now)]
+            if not candidates:
+                # 所有端点都在冷却中：选择最早结束冷却的端点，而不是直接失败
+                return min(self._states, key=lambda s: (s.url in excluded, s.unhealthy_until)).url
+
+            candidates.sort(key=_EndpointState.score)
+            if len(candidates) > 1 and random.random() < self.explore_ratio:
+                return random.choice(candidates[1:]).url
+            return candidates[0].url
+
+    def has_alternative(self, exclude: Iterable[str]) -> bool:
+        """是否还有未尝试过的健康端点（有则失败后可以立即切换，无需退避等待）"""
+        excluded = set(exclude)
+        now = time.monotonic()
+        with self._lock:
+            return any(s.is_healthy(now) and s.url not in excluded for s in self._states)
+
+    def record_success(self, url: str, latency: float):
+        """记录一次成功响应及其延迟"""
+        with self._lock:
+            state = self._by_url.get(url)
+            if state is None:
+                return
+            state.successes += 1
+            state.consecutive_failures = 0
+            state.unhealthy_until = 0.0
+            if state.latency is None:
+                state.latency = latency
+            else:
+                state.latency += self.ewma_alpha * (latency - state.latency)
+
+    def record_failure(self, url: str):
+        """记录一次失败（超时、连接失败或5xx）"""
+        with self._lock:
+            state = self._by_url.get(url)
+            if state is None:
+                return
+            state.failures += 1
+            state.consecutive_failures += 1
+            if state.consecutive_failures >= self.failure_threshold:
+                state.unhealthy_until = time.monotonic() + self.cooldown
+
+    def get_status(self) -> List[Dict[str, Any]]:
+        """获取各端点的健康状态"""
+        now = time.monotonic()
+        with self._lock:
+            return [{
+                "url": s.url,
+                "weight": s.weight,
+                "healthy": s.is_healthy(now),
+                "latency_ms": s.latency * 1000 if s.latency is not None else None,
+                "successes": s.successes,
+                "failures": s.failures,
+                "consecutive_failures": s.consecutive_failures,
+            } for s in self._states]
+
+# 相同端点配置的客户端共享同一个路由器，使健康数据在所有请求间累积
+_routers: Dict[Tuple, EndpointRouter] = {}
+_routers_lock = threading.Lock()
+
+def get_router(config: Optional[FluxKontextConfig] = None) -> EndpointRouter:
+    """获取与配置中端点列表对应的共享路由器"""
+    config = config or default_config
+    endpoints = config.get_api_base_urls()
+    options = (
+        config.get_config('endpoint_failure_threshold', 2),
+        config.get_config('endpoint_cooldown', 30),
+    )
+    router_key = (tuple(endpoints), options)
+    with _routers_lock:
+        router = _routers.get(router_key)
+        if router is None:
+            router = EndpointRouter(endpoints, failure_threshold=options[0], cooldown=options[1])
+            _routers[router_key] = router
+        return router
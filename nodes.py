@@ -3,13 +3,17 @@ ComfyUI节点实现
 定义Flux-Kontext图像生成节点
 """
 
+import io
+import functools
 import torch
 import random
 import os
 import tempfile
 import logging
-from typing import Any, Tuple, Optional, Dict, List
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import threading
+import time
+from typing import Any, Tuple, Optional, Dict, List, Union
+from concurrent.futures import CancelledError, Future, as_completed
 
 try:
     import fal_client
@@ -18,40 +22,63 @@ except ImportError:
 
 # 尝试相对导入，如果失败则使用绝对导入
 try:
-    from .api_client import FluxKontextAPI, FluxKontextAPIError
+    from .api_client import FluxKontextAPI, FluxKontextAPIError, FluxKontextAPIRejectedError, start_background_prewarm
     from .config import default_config
-    from .utils import download_image, pil_to_tensor, format_error_message, tensor_to_pil
+    from .utils import download_image, decode_image, pil_to_tensor, format_error_message, tensor_to_pil, composite_references, FrameSpillBuffer
+    from .scheduler import new_fairness_key
+    from .pipeline import PipelineRun, get_pipeline
+    from .singleflight import make_fingerprint, get_flight
 except ImportError:
-    from api_client import FluxKontextAPI, FluxKontextAPIError
+    from api_client import FluxKontextAPI, FluxKontextAPIError, FluxKontextAPIRejectedError, start_background_prewarm
     from config import default_config
-    from utils import download_image, pil_to_tensor, format_error_message, tensor_to_pil
+    from utils import download_image, decode_image, pil_to_tensor, format_error_message, tensor_to_pil, composite_references, FrameSpillBuffer
+    from scheduler import new_fairness_key
+    from pipeline import PipelineRun, get_pipeline
+    from singleflight import make_fingerprint, get_flight
+
+# 节点加载时在后台预热到API/CDN的连接，首次生成无需承担冷连接延迟
+start_background_prewarm()
 
 class SuppressFalLogs:
-    """临时抑制FAL相关的详细HTTP日志的上下文管理器"""
+    """
+    临时抑制FAL相关的详细HTTP日志的上下文管理器
     
-    def __init__(self):
-        self.loggers_to_suppress = [
-            'httpx',
-            'httpcore', 
-            'fal_client',
-            'fal',
-            'urllib3.connectionpool'
-        ]
-        self.original_levels = {}
+    日志级别是进程级的全局状态，而上传可能在多个线程中同时进行。
+    这里使用引用计数：第一个进入者保存原始级别，最后一个退出者负责恢复，
+    避免并发时把已被抑制的WARNING级别误当作原始级别永久保留下来。
+    """
+    
+    loggers_to_suppress = [
+        'httpx',
+        'httpcore', 
+        'fal_client',
+        'fal',
+        'urllib3.connectionpool'
+    ]
+    
+    _lock = threading.Lock()
+    _depth = 0
+    _original_levels: Dict[str, int] = {}
     
     def __enter__(self):
-        # 保存原始日志级别并设置为WARNING以上
-        for logger_name in self.loggers_to_suppress:
-            logger = logging.getLogger(logger_name)
-            self.original_levels[logger_name] = logger.level
-            logger.setLevel(logging.WARNING)
+        with SuppressFalLogs._lock:
+            if SuppressFalLogs._depth == 0:
+                # 保存原始日志级别并设置为WARNING以上
+                for logger_name in self.loggers_to_suppress:
+                    logger = logging.getLogger(logger_name)
+                    SuppressFalLogs._original_levels[logger_name] = logger.level
+                    logger.setLevel(logging.WARNING)
+            SuppressFalLogs._depth += 1
         return self
     
     def __exit__(self, exc_type, exc_val, exc_tb):
-        # 恢复原始日志级别
-        for logger_name, original_level in self.original_levels.items():
-            logger = logging.getLogger(logger_name)
-            logger.setLevel(original_level)
+        with SuppressFalLogs._lock:
+            SuppressFalLogs._depth -= 1
+            if SuppressFalLogs._depth == 0:
+                # 恢复原始日志级别
+                for logger_name, original_level in SuppressFalLogs._original_levels.items():
+                    logging.getLogger(logger_name).setLevel(original_level)
+                SuppressFalLogs._original_levels.clear()
 
 class _FluxKontextNodeBase:
     """
@@ -73,43 +100,170 @@ class _FluxKontextNodeBase:
             
         return {"ui": {"string": [error_message]}, "result": (image_out, f"失败: {error_message}")}
 
-    def _execute_generation(self, tuzi_api_key: str, final_prompt: str, num_images: int, seed: int, model: str, **kwargs) -> Tuple[List[Any], List[str], List[str]]:
-        results_pil, result_urls, errors = [], [], []
+    def _upload_reference_image(self, pil_image) -> str:
+        """
+        上传参考图像到FAL存储并返回URL
+        
+        按PNG字节内容计算指纹，内容相同的并发上传只执行一次。
+        """
+        buffer = io.BytesIO()
+        pil_image.save(buffer, 'PNG')
+        data = buffer.getvalue()
 
-        def generate_single_image(current_seed):
+        def upload():
+            with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as temp_file:
+                temp_file.write(data)
+                temp_file_path = temp_file.name
             try:
-                api_client = FluxKontextAPI(api_key=tuzi_api_key)
-                api_params = {
-                    "prompt": final_prompt,
-                    "model": model,
-                    "seed": current_seed,
-                }
-                api_params.update(kwargs)
-                pil_image, url = api_client.generate_image(**api_params)
-                return pil_image, url
-            except Exception as e:
-                return e
+                with SuppressFalLogs():
+                    return fal_client.upload_file(temp_file_path)
+            finally:
+                if os.path.exists(temp_file_path):
+                    os.unlink(temp_file_path)
+
+        return get_flight("upload").do(make_fingerprint(data), upload)
+
+    def _prepare_references(self, images_in: List[torch.Tensor], reference_mode: str = "separate",
+                            composite_layout: str = "horizontal",
+                            composite_max_megapixels: float = 1.0) -> Tuple[List[str], bool]:
+        """
+        上传参考图像并返回URL列表
+        
+        composite模式下先在本地将多张参考图拼接成一张，只需编码和上传一次。
+        
+        Returns:
+            Tuple: (参考图URL列表, 是否拼接为一张上传)
+        """
+        composited = reference_mode == "composite" and len(images_in) > 1
+        if composited:
+            max_pixels = int(composite_max_megapixels * 1024 * 1024)
+            images_in = [composite_references(images_in, layout=composite_layout, max_pixels=max_pixels)]
 
-        with ThreadPoolExecutor(max_workers=min(num_images, 4)) as executor:
-            # 限制seed在32位整数范围内，避免API解析错误
-            seeds = [seed + i if seed != 0 else random.randint(1, 2147483647) for i in range(num_images)]
-            future_to_seed = {executor.submit(generate_single_image, s): s for s in seeds}
-            
-            for future in as_completed(future_to_seed):
-                try:
-                    result = future.result()
-                    if isinstance(result, Exception):
-                        # 简化错误信息，不显示技术细节
-                        errors.append(f"图像生成失败")
-                    else:
-                        pil_img, url = result
-                        results_pil.append(pil_img)
-                        result_urls.append(url)
-                except Exception as exc:
-                    errors.append(f"图像生成异常")
+        uploaded_urls = []
+        for image_tensor in images_in:
+            pil_images = tensor_to_pil(image_tensor)
+            if not pil_images: continue
+
+            uploaded_urls.append(self._upload_reference_image(pil_images[0]))
+        return uploaded_urls, composited
+
+    def _create_result_buffer(self, num_images: int) -> Optional[FrameSpillBuffer]:
+        """内存受限输出模式下创建磁盘帧缓冲区，标准模式返回None"""
+        if default_config.get_config('output_mode', 'standard') != 'memory_bounded':
+            return None
+        return FrameSpillBuffer(num_images, memory_budget_mb=default_config.get_config('output_memory_budget_mb', 256))
+
+    def _results_to_tensor(self, results: Union[List[Any], FrameSpillBuffer]) -> torch.Tensor:
+        """将收集到的结果转换为ComfyUI图像张量"""
+        if isinstance(results, FrameSpillBuffer):
+            with results:
+                return results.to_tensor()
+        return pil_to_tensor(results)
+
+    def _submit_generation(self, tuzi_api_key: str, final_prompt: str, num_images: int, seed: int, model: str,
+                           priority: str = "interactive", result_buffer: Optional[FrameSpillBuffer] = None,
+                           **kwargs) -> Tuple[List[Future], PipelineRun]:
+        """
+        将每个种子的生成提交到分阶段流水线，立即返回Future列表和本次运行的统计窗口
+        
+        API阶段在全局调度器上执行，拿到图像URL后即归还并发槽位；下载和解码在各自的工作池中完成。
+        传入result_buffer时，图像在解码阶段直接写入缓冲区并立即释放，Future只携带URL。
+        """
+        # 同一批次共享的拒绝状态：一个种子被确定性拒绝（如内容审核）后，
+        # 尚未开始的其他种子直接以相同原因失败，不再发送请求
+        batch_rejection: List[FluxKontextAPIRejectedError] = []
+        api_client = FluxKontextAPI(api_key=tuzi_api_key)
+
+        def build_params(current_seed):
+            api_params = {
+                "prompt": final_prompt,
+                "model": model,
+                "seed": current_seed,
+            }
+            api_params.update(kwargs)
+            return api_params
+
+        def request_single_image(current_seed):
+            if batch_rejection:
+                raise batch_rejection[0]
+            try:
+                return api_client.request_image_url(**build_params(current_seed))
+            except FluxKontextAPIRejectedError as e:
+                batch_rejection.append(e)
+                raise
+
+        def decode_single_image(data: bytes):
+            pil_image = decode_image(data)
+            if result_buffer is not None:
+                result_buffer.append(pil_image)
+                return None
+            return pil_image
+
+        # 所有节点共享全局调度器；同一次执行的作业使用同一个公平键，
+        # 避免一个大批量任务阻塞其他节点的交互请求。
+        # 与进行中的请求指纹相同的生成在进入调度器之前合并，等待者不占用API并发槽位
+        pipeline = get_pipeline()
+        run = pipeline.begin_run()
+        fairness_key = new_fairness_key(self.__class__.__name__)
+        # 限制seed在32位整数范围内，避免API解析错误
+        seeds = [seed + i if seed != 0 else random.randint(1, 2147483647) for i in range(num_images)]
+        futures = [
+            pipeline.submit(
+                functools.partial(request_single_image, s),
+                api_client.fetch_image_bytes,
+                decode_single_image,
+                priority=priority,
+                key=fairness_key,
+                coalesce_key=api_client.request_fingerprint(api_client.build_payload(**build_params(s))),
+                run=run,
+            )
+            for s in seeds
+        ]
+        run.seal()
+        return futures, run
+
+    def _collect_generation(self, futures: List[Future], run: Optional[PipelineRun] = None,
+                            result_buffer: Optional[FrameSpillBuffer] = None
+                            ) -> Tuple[Union[List[Any], FrameSpillBuffer], List[str], List[str]]:
+        """
+        等待所有生成任务完成并汇总结果；使用缓冲区时返回缓冲区代替图像列表
+        
+        传入run时输出本次运行期间各阶段的平均/峰值队列深度、利用率和瓶颈阶段。
+        """
+        results_pil, result_urls, errors = [], [], []
+        
+        for future in as_completed(futures):
+            try:
+                pil_img, url = future.result()
+                if pil_img is not None:
+                    results_pil.append(pil_img)
+                result_urls.append(url)
+            except FluxKontextAPIRejectedError as e:
+                # 确定性拒绝需要用户修改输入，显示原始原因
+                errors.append(f"请求被拒绝: {e}")
+            except CancelledError:
+                errors.append("图像生成已取消")
+            except Exception:
+                # 简化错误信息，不显示技术细节
+                errors.append("图像生成失败")
+        
+        # 统计窗口在最后一个Future的完成回调中结束，可能略晚于as_completed返回
+        if run is not None and run.wait(timeout=1):
+            print(f"📊 流水线负载: {run.format_report()}")
         
+        if result_buffer is not None:
+            if not result_buffer:
+                result_buffer.close()
+            return result_buffer, result_urls, errors
         return results_pil, result_urls, errors
 
+    def _execute_generation(self, tuzi_api_key: str, final_prompt: str, num_images: int, seed: int, model: str,
+                            **kwargs) -> Tuple[Union[List[Any], FrameSpillBuffer], List[str], List[str]]:
+        result_buffer = self._create_result_buffer(num_images)
+        futures, run = self._submit_generation(tuzi_api_key, final_prompt, num_images, seed, model,
+                                               result_buffer=result_buffer, **kwargs)
+        return self._collect_generation(futures, run, result_buffer)
+
 # 节点1: 文生图
 class FluxKontext_TextToImage(_FluxKontextNodeBase):
     @classmethod
@@ -126,6 +280,9 @@ class FluxKontext_TextToImage(_FluxKontextNodeBase):
                 "output_format": (default_config.SUPPORTED_OUTPUT_FORMATS, {"default": "png"}),
                 "safety_tolerance": ("INT", {"default": 3, "min": 0, "max": 6}),
                 "prompt_upsampling": ("BOOLEAN", {"default": False}),
+            },
+            "optional": {
+                "priority": (default_config.SUPPORTED_PRIORITIES, {"default": "interactive"}),
             }
         }
 
@@ -145,14 +302,14 @@ class FluxKontext_TextToImage(_FluxKontextNodeBase):
         results_pil, result_urls, errors = self._execute_generation(tuzi_api_key, final_prompt, num_images, seed, model, **kwargs)
 
         if not results_pil:
-            return self._create_error_result(f"All image generations failed.\n{'; '.join(errors)}")
+            return self._create_error_result(f"All image generations failed.\n{'; '.join(dict.fromkeys(errors))}")
 
         success_count = len(results_pil)
         final_status = f"🐰文生图模式 | 成功生成: {success_count}/{num_images} 张图像"
         if errors:
             final_status += f" | 失败: {len(errors)} 张"
         
-        return {"ui": {"string": [final_status]}, "result": (pil_to_tensor(results_pil), final_status)}
+        return {"ui": {"string": [final_status]}, "result": (self._results_to_tensor(results_pil), final_status)}
 
 # 节点2: 图生图 (单图)
 class FluxKontext_ImageToImage(_FluxKontextNodeBase):
@@ -171,6 +328,9 @@ class FluxKontext_ImageToImage(_FluxKontextNodeBase):
                 "output_format": (default_config.SUPPORTED_OUTPUT_FORMATS, {"default": "png"}),
                 "safety_tolerance": ("INT", {"default": 3, "min": 0, "max": 6}),
                 "prompt_upsampling": ("BOOLEAN", {"default": False}),
+            },
+            "optional": {
+                "priority": (default_config.SUPPORTED_PRIORITIES, {"default": "interactive"}),
             }
         }
 
@@ -188,25 +348,16 @@ class FluxKontext_ImageToImage(_FluxKontextNodeBase):
         fal_key = default_config.get_fal_key()
         
         os.environ['FAL_KEY'] = fal_key
-        temp_file_path = None
         try:
             pil_images = tensor_to_pil(image)
             if not pil_images:
                 return self._create_error_result("Cannot convert input image.", image)
             
-            with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as temp_file:
-                pil_images[0].save(temp_file, 'PNG')
-                temp_file_path = temp_file.name
-            
-            with SuppressFalLogs():
-                uploaded_url = fal_client.upload_file(temp_file_path)
+            uploaded_url = self._upload_reference_image(pil_images[0])
             final_prompt = f"{uploaded_url} {kwargs['prompt']}"
 
         except Exception as e:
             return self._create_error_result(f"Image-to-Image preparation failed: {format_error_message(e)}", image)
-        finally:
-            if temp_file_path and os.path.exists(temp_file_path):
-                os.unlink(temp_file_path)
 
         num_images = kwargs.pop("num_images")
         seed = kwargs.pop("seed")
@@ -216,14 +367,14 @@ class FluxKontext_ImageToImage(_FluxKontextNodeBase):
         results_pil, result_urls, errors = self._execute_generation(tuzi_api_key, final_prompt, num_images, seed, model, **kwargs)
         
         if not results_pil:
-            return self._create_error_result(f"All image generations failed.\n{'; '.join(errors)}", image)
+            return self._create_error_result(f"All image generations failed.\n{'; '.join(dict.fromkeys(errors))}", image)
 
         success_count = len(results_pil)
         final_status = f"🐰图生图模式 | 成功生成: {success_count}/{num_images} 张图像"
         if errors:
             final_status += f" | 失败: {len(errors)} 张"
         
-        return {"ui": {"string": [final_status]}, "result": (pil_to_tensor(results_pil), final_status)}
+        return {"ui": {"string": [final_status]}, "result": (self._results_to_tensor(results_pil), final_status)}
 
 # 节点3: 多图生图
 class FluxKontext_MultiImageToImage(_FluxKontextNodeBase):
@@ -243,6 +394,10 @@ class FluxKontext_MultiImageToImage(_FluxKontextNodeBase):
                 "prompt_upsampling": ("BOOLEAN", {"default": False}),
             },
             "optional": {
+                "priority": (default_config.SUPPORTED_PRIORITIES, {"default": "interactive"}),
+                "reference_mode": (default_config.SUPPORTED_REFERENCE_MODES, {"default": "separate"}),
+                "composite_layout": (default_config.SUPPORTED_COMPOSITE_LAYOUTS, {"default": "horizontal"}),
+                "composite_max_megapixels": ("FLOAT", {"default": 1.0, "min": 0.1, "max": 4.0, "step": 0.1}),
                 "image_1": ("IMAGE",),
                 "image_2": ("IMAGE",),
                 "image_3": ("IMAGE",),
@@ -267,19 +422,15 @@ class FluxKontext_MultiImageToImage(_FluxKontextNodeBase):
         
         os.environ['FAL_KEY'] = fal_key
         
-        uploaded_urls = []
-        temp_files = []
+        reference_mode = kwargs.pop("reference_mode", "separate")
+        composite_layout = kwargs.pop("composite_layout", "horizontal")
+        composite_max_megapixels = kwargs.pop("composite_max_megapixels", 1.0)
+
+        reference_count = len(images_in)
         try:
-            for i, image_tensor in enumerate(images_in):
-                pil_images = tensor_to_pil(image_tensor)
-                if not pil_images: continue
-
-                with tempfile.NamedTemporaryFile(suffix=f'_{i}.png', delete=False) as temp_file:
-                    pil_images[0].save(temp_file, 'PNG')
-                    temp_files.append(temp_file.name)
-                
-                with SuppressFalLogs():
-                    uploaded_urls.append(fal_client.upload_file(temp_files[-1]))
+            uploaded_urls, composited = self._prepare_references(
+                images_in, reference_mode, composite_layout, composite_max_megapixels
+            )
             
             if not uploaded_urls:
                 return self._create_error_result("All input images could not be processed or uploaded.")
@@ -289,10 +440,6 @@ class FluxKontext_MultiImageToImage(_FluxKontextNodeBase):
 
         except Exception as e:
             return self._create_error_result(f"Multi-Image upload failed: {format_error_message(e)}")
-        finally:
-            for path in temp_files:
-                if os.path.exists(path):
-                    os.unlink(path)
         
         num_images = kwargs.pop("num_images")
         seed = kwargs.pop("seed")
@@ -303,24 +450,189 @@ class FluxKontext_MultiImageToImage(_FluxKontextNodeBase):
         results_pil, result_urls, errors = self._execute_generation(tuzi_api_key, final_prompt, num_images, seed, model, **kwargs)
         
         if not results_pil:
-            return self._create_error_result(f"All image generations failed.\n{'; '.join(errors)}")
+            return self._create_error_result(f"All image generations failed.\n{'; '.join(dict.fromkeys(errors))}")
+
+        success_count = len(results_pil)
+        if composited:
+            final_status = f"🐰多图生图模式 | 参考图片: {reference_count} 张 (拼接为1张上传)"
+        else:
+            final_status = f"🐰多图生图模式 | 参考图片: {len(uploaded_urls)} 张"
+        final_status += f" | 成功生成: {success_count}/{num_images} 张图像"
+        if errors:
+            final_status += f" | 失败: {len(errors)} 张"
+
+        return {"ui": {"string": [final_status]}, "result": (self._results_to_tensor(results_pil), final_status)}
+
+class _GenerationJob:
+    """已提交但尚未收集的生成任务"""
+
+    def __init__(self, futures: List[Future], num_images: int, reference_count: int,
+                 result_buffer: Optional[FrameSpillBuffer] = None, run: Optional[PipelineRun] = None):
+        self.futures = futures
+        self.run = run
+        self.result_buffer = result_buffer
+        self.num_images = num_images
+        self.reference_count = reference_count
+        self.created_at = time.monotonic()
+
+# 异步任务登记表: 任务ID -> 任务。超过job_ttl仍未被收集的任务会被取消并移除
+_pending_jobs: Dict[str, _GenerationJob] = {}
+_pending_jobs_lock = threading.Lock()
+
+def _register_job(job: _GenerationJob) -> str:
+    """登记任务并返回任务ID，同时清理过期任务"""
+    ttl = default_config.get_config('job_ttl', 3600)
+    now = time.monotonic()
+    with _pending_jobs_lock:
+        for job_id in [k for k, v in _pending_jobs.items() if now - v.created_at > ttl]:
+            expired = _pending_jobs.pop(job_id)
+            for future in expired.futures:
+                future.cancel()
+            if expired.result_buffer is not None:
+                expired.result_buffer.close()
+        job_id = new_fairness_key("job")
+        _pending_jobs[job_id] = job
+    return job_id
+
+def _take_job(job_id: Optional[str]) -> Optional[_GenerationJob]:
+    """取出并移除任务"""
+    with _pending_jobs_lock:
+        return _pending_jobs.pop(job_id, None) if job_id else None
+
+# 节点4: 异步提交
+class FluxKontext_Submit(_FluxKontextNodeBase):
+    """
+    提交生成任务后立即返回任务句柄，工作流中其他互不依赖的节点可以在远程生成期间继续执行，
+    之后由 FluxKontext_Collect 节点等待并取回结果。
+    """
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "prompt": ("STRING", {"multiline": True, "default": "The character is sitting cross-legged on the sofa, and the Dalmatian is lying on the blanket sleeping."}),
+                "model": (["flux-kontext-pro", "flux-kontext-max"], {"default": "flux-kontext-max"}),
+                "num_images": ([1, 2, 3, 4], {"default": 1}),
+                "seed": ("INT", {"default": 0, "min": 0, "max": 0xffffffffffffffff}),
+                "guidance_scale": ("FLOAT", {"default": 3.5, "min": 0.0, "max": 10.0, "step": 0.1}),
+                "num_inference_steps": ("INT", {"default": 28, "min": 1, "max": 100}),
+                "aspect_ratio": (default_config.SUPPORTED_ASPECT_RATIOS, {"default": "1:1"}),
+                "output_format": (default_config.SUPPORTED_OUTPUT_FORMATS, {"default": "png"}),
+                "safety_tolerance": ("INT", {"default": 3, "min": 0, "max": 6}),
+                "prompt_upsampling": ("BOOLEAN", {"default": False}),
+            },
+            "optional": {
+                "priority": (default_config.SUPPORTED_PRIORITIES, {"default": "interactive"}),
+                "reference_mode": (default_config.SUPPORTED_REFERENCE_MODES, {"default": "separate"}),
+                "composite_layout": (default_config.SUPPORTED_COMPOSITE_LAYOUTS, {"default": "horizontal"}),
+                "composite_max_megapixels": ("FLOAT", {"default": 1.0, "min": 0.1, "max": 4.0, "step": 0.1}),
+                "image_1": ("IMAGE",),
+                "image_2": ("IMAGE",),
+                "image_3": ("IMAGE",),
+                "image_4": ("IMAGE",),
+            }
+        }
+
+    RETURN_TYPES = ("FLUX_KONTEXT_JOB", "STRING")
+    RETURN_NAMES = ("job", "status")
+
+    def _create_submit_error(self, error_message: str) -> Dict[str, Any]:
+        print(f"节点执行错误: {error_message}")
+        return {"ui": {"string": [error_message]}, "result": (None, f"失败: {error_message}")}
+
+    def execute(self, **kwargs):
+        tuzi_api_key = default_config.get_api_key()
+        if not tuzi_api_key:
+            return self._create_submit_error(default_config.api_key_error_message)
+
+        images_in = [kwargs.pop(f"image_{i}", None) for i in range(1, 5)]
+        images_in = [image for image in images_in if image is not None]
+
+        reference_mode = kwargs.pop("reference_mode", "separate")
+        composite_layout = kwargs.pop("composite_layout", "horizontal")
+        composite_max_megapixels = kwargs.pop("composite_max_megapixels", 1.0)
+
+        final_prompt = kwargs.pop("prompt")
+        composited = False
+        if images_in:
+            if fal_client is None:
+                return self._create_submit_error("Error: 'fal-client' not installed. Please run pip install -r requirements.txt")
+            os.environ['FAL_KEY'] = default_config.get_fal_key()
+            try:
+                uploaded_urls, composited = self._prepare_references(
+                    images_in, reference_mode, composite_layout, composite_max_megapixels
+                )
+                if not uploaded_urls:
+                    return self._create_submit_error("All input images could not be processed or uploaded.")
+                final_prompt = f"{' '.join(uploaded_urls)} {final_prompt}"
+            except Exception as e:
+                return self._create_submit_error(f"Reference image upload failed: {format_error_message(e)}")
+
+        num_images = kwargs.pop("num_images")
+        seed = kwargs.pop("seed")
+        model = kwargs.pop("model")
+
+        result_buffer = self._create_result_buffer(num_images)
+        futures, run = self._submit_generation(tuzi_api_key, final_prompt, num_images, seed, model,
+                                               result_buffer=result_buffer, **kwargs)
+        job_id = _register_job(_GenerationJob(futures, num_images, len(images_in), result_buffer, run))
+
+        final_status = f"🐰异步提交 | 任务: {job_id} | 已提交: {num_images} 张图像"
+        if images_in:
+            final_status += f" | 参考图片: {len(images_in)} 张"
+            if composited:
+                final_status += " (拼接为1张上传)"
+        return {"ui": {"string": [final_status]}, "result": (job_id, final_status)}
+
+# 节点5: 异步收集
+class FluxKontext_Collect(_FluxKontextNodeBase):
+    """等待 FluxKontext_Submit 提交的任务完成，下载并返回图像"""
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "job": ("FLUX_KONTEXT_JOB",),
+            }
+        }
+
+    RETURN_TYPES = ("IMAGE", "STRING")
+    RETURN_NAMES = ("image", "status")
+
+    def execute(self, job):
+        generation_job = _take_job(job)
+        if generation_job is None:
+            return self._create_error_result("任务不存在或已过期，请重新运行提交节点。")
+
+        results_pil, result_urls, errors = self._collect_generation(generation_job.futures, generation_job.run,
+                                                                    generation_job.result_buffer)
+
+        if not results_pil:
+            return self._create_error_result(f"All image generations failed.\n{'; '.join(dict.fromkeys(errors))}")
 
         success_count = len(results_pil)
-        final_status = f"🐰多图生图模式 | 参考图片: {len(uploaded_urls)} 张 | 成功生成: {success_count}/{num_images} 张图像"
+        final_status = "🐰异步收集"
+        if generation_job.reference_count:
+            final_status += f" | 参考图片: {generation_job.reference_count} 张"
+        final_status += f" | 成功生成: {success_count}/{generation_job.num_images} 张图像"
         if errors:
             final_status += f" | 失败: {len(errors)} 张"
 
-        return {"ui": {"string": [final_status]}, "result": (pil_to_tensor(results_pil), final_status)}
+        return {"ui": {"string": [final_status]}, "result": (self._results_to_tensor(results_pil), final_status)}
 
 
 NODE_CLASS_MAPPINGS = {
     "FluxKontext_TextToImage": FluxKontext_TextToImage,
     "FluxKontext_ImageToImage": FluxKontext_ImageToImage,
     "FluxKontext_MultiImageToImage": FluxKontext_MultiImageToImage,
+    "FluxKontext_Submit": FluxKontext_Submit,
+    "FluxKontext_Collect": FluxKontext_Collect,
 }
 
 NODE_DISPLAY_NAME_MAPPINGS = {
     "FluxKontext_TextToImage": "🐰Flux.1 Kontext - Text to Image",
     "FluxKontext_ImageToImage": "🐰Flux.1 Kontext - Editing",
     "FluxKontext_MultiImageToImage": "🐰Flux.1 Kontext - Editing (Multi Image)",
+    "FluxKontext_Submit": "🐰Flux.1 Kontext - Submit (Async)",
+    "FluxKontext_Collect": "🐰Flux.1 Kontext - Collect (Async)",
 } 
\ No newline at end of file
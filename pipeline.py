@@ -0,0 +1,463 @@
+"""
+分阶段生成流水线
+将一次生成拆分为 提交/等待（API）、下载、解码/转换 三个阶段：
+API阶段运行在全局调度器上，拿到图像URL后立即归还API并发槽位；
+下载和解码各自使用独立的有界工作池，阶段之间通过有界队列衔接。
+"""
+
+import queue
+import threading
+import time
+import weakref
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional, Tuple
+try:
+    from .config import default_config
+    from .scheduler import JobScheduler, get_scheduler
+except ImportError:
+    from config import default_config
+    from scheduler import JobScheduler, get_scheduler
+
+STAGE_LABELS = {"api": "API", "download": "下载", "decode": "解码"}
+
+class StageClock:
+    """
+    阶段的时间加权统计
+
+    记录排队数和忙碌线程数随时间的累计面积，任意两个时刻的快照相减即可得到
+    这段时间内的平均队列深度和利用率，不受进程运行时长影响。
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.busy = 0
+        self._last = time.monotonic()
+        self._queue_area = 0.0
+        self._busy_area = 0.0
+        # 正在统计中的运行窗口，排队数变化时更新它们的峰值
+        self._watchers: "weakref.WeakSet[PipelineRun]" = weakref.WeakSet()
+
+    def _advance(self, now: float):
+        """累计上次变化以来的面积（调用方需持有锁）"""
+        elapsed = now - self._last
+        self._queue_area += self.queued * elapsed
+        self._busy_area += self.busy * elapsed
+        self._last = now
+
+    def enqueue(self):
+        """一个任务进入队列"""
+        with self._lock:
+            self._advance(time.monotonic())
+            self.queued += 1
+            depth = self.queued
+            watchers = list(self._watchers)
+        for run in watchers:
+            run.observe(self.name, depth)
+
+    def discard(self):
+        """排队中的任务被取消"""
+        with self._lock:
+            self._advance(time.monotonic())
+            self.queued -= 1
+
+    def start(self):
+        """任务出队开始执行"""
+        with self._lock:
+            self._advance(time.monotonic())
+            self.queued -= 1
+            self.busy += 1
+
+    def finish(self):
+        """任务执行结束"""
+        with self._lock:
+            self._advance(time.monotonic())
+            self.busy -= 1
+
+    def snapshot(self) -> Tuple[float, float, float, int]:
+        """返回 (时刻, 排队面积, 忙碌面积, 当前排队数)"""
+        with self._lock:
+            now = time.monotonic()
+            self._advance(now)
+            return now, self._queue_area, self._busy_area, self.queued
+
+    def watch(self, run: "PipelineRun"):
+        with self._lock:
+            self._watchers.add(run)
+
+    def unwatch(self, run: "PipelineRun"):
+        with self._lock:
+            self._watchers.discard(run)
+
+class PipelineStage:
+    """
+    流水线中的一个阶段：固定数量的工作线程和一个有界输入队列
+
+    队列已满时提交会阻塞，把压力传导回上游阶段，避免中间结果无限堆积；
+    阻塞等待入队的任务同样计入排队数。
+    """
+
+    def __init__(self, name: str, workers: int, queue_size: int):
+        """
+        初始化阶段
+
+        Args:
+            name: 阶段名称
+            workers: 工作线程数
+            queue_size: 输入队列容量
+        """
+        self.name = name
+        self.workers = max(1, int(workers))
+        self.clock = StageClock(name)
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max(1, int(queue_size)))
+        self._lock = threading.Lock()
+        self._threads = []
+        self._busy_time = 0.0
+        self._processed = 0
+        self._failed = 0
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """提交任务，队列已满时阻塞等待"""
+        future = Future()
+        self._ensure_workers()
+        self.clock.enqueue()
+        self._queue.put((future, fn, args, kwargs))
+        return future
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        获取阶段当前状态
+
+        Returns:
+            Dict: 当前队列深度、忙碌线程数和累计处理数等
+        """
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "busy": self.clock.busy,
+                "queue_depth": self.clock.queued,
+                "queue_capacity": self._queue.maxsize,
+                "processed": self._processed,
+                "failed": self._failed,
+                "avg_service_ms": (self._busy_time / self._processed * 1000) if self._processed else 0.0,
+            }
+
+    def _ensure_workers(self):
+        with self._lock:
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(
+                    target=self._worker_loop,
+                    name=f"FluxKontext-{self.name}-{len(self._threads)}",
+                    daemon=True
+                )
+                self._threads.append(thread)
+                thread.start()
+
+    def _worker_loop(self):
+        while True:
+            future, fn, args, kwargs = self._queue.get()
+            if not future.set_running_or_notify_cancel():
+                self.clock.discard()
+                continue
+            self.clock.start()
+            started = time.monotonic()
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as e:
+                future.set_exception(e)
+                failed = True
+            else:
+                future.set_result(result)
+                failed = False
+            self.clock.finish()
+            with self._lock:
+                self._busy_time += time.monotonic() - started
+                self._processed += 1
+                self._failed += failed
+
+class PipelineRun:
+    """
+    一次节点执行在流水线上的统计窗口
+
+    从提交开始，到最后一个结果完成为止。窗口内各阶段的平均/峰值队列深度和利用率
+    反映的是这次运行期间（包括同时运行的其他节点）流水线的实际负载，
+    据此判断哪个阶段是瓶颈。
+    """
+
+    def __init__(self, stages: Dict[str, Tuple[StageClock, Callable[[], int]]]):
+        """
+        Args:
+            stages: 阶段名称 -> (统计时钟, 返回当前工作线程数的函数)
+        """
+        self._stages = stages
+        self._lock = threading.Lock()
+        self._start = {name: clock.snapshot() for name, (clock, _) in stages.items()}
+        self._peak = {name: snapshot[3] for name, snapshot in self._start.items()}
+        # 初始为1，由seal()抵消，避免在全部Future登记完成之前就结束窗口
+        self._pending = 1
+        self._finished = threading.Event()
+        self.report: Optional[Dict[str, Dict[str, float]]] = None
+        for clock, _ in stages.values():
+            clock.watch(self)
+
+    def observe(self, name: str, depth: int):
+        """记录阶段排队数，用于峰值统计"""
+        with self._lock:
+            if depth > self._peak.get(name, 0):
+                self._peak[name] = depth
+
+    def track(self, future: Future):
+        """登记属于本次运行的结果Future"""
+        with self._lock:
+            self._pending += 1
+        future.add_done_callback(self._on_done)
+
+    def seal(self):
+        """全部Future登记完毕"""
+        self._on_done(None)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._finished.wait(timeout)
+
+    def _on_done(self, _future: Optional[Future]):
+        with self._lock:
+            self._pending -= 1
+            if self._pending > 0:
+                return
+        self._finish()
+
+    def _finish(self):
+        report = {}
+        for name, (clock, workers) in self._stages.items():
+            clock.unwatch(self)
+            start_time, start_queue, start_busy, _ = self._start[name]
+            end_time, end_queue, end_busy, _ = clock.snapshot()
+            duration = end_time - start_time
+            worker_count = max(1, workers())
+            capacity = duration * worker_count
+            report[name] = {
+                "workers": worker_count,
+                "duration_ms": duration * 1000,
+                "avg_queue_depth": (end_queue - start_queue) / duration if duration > 0 else 0.0,
+                "peak_queue_depth": self._peak[name],
+                "utilisation": min(1.0, (end_busy - start_busy) / capacity) if capacity > 0 else 0.0,
+            }
+        self.report = report
+        self._finished.set()
+
+    def bottleneck(self) -> Optional[str]:
+        """
+        返回本次运行的瓶颈阶段
+
+        负载 = 利用率 + 平均队列深度/工作线程数：线程持续忙碌或任务持续积压的阶段负载最高。
+        运行期间各阶段都没有工作时返回None。
+        """
+        if not self.report:
+            return None
+        load = {name: m["utilisation"] + m["avg_queue_depth"] / m["workers"] for name, m in self.report.items()}
+        name = max(load, key=load.get)
+        return name if load[name] > 0 else None
+
+    def format_report(self) -> str:
+        """将本次运行的各阶段统计格式化为一行状态文本"""
+        if not self.report:
+            return "统计未完成"
+        parts = [
+            f"{STAGE_LABELS.get(name, name)} 平均队列{m['avg_queue_depth']:.1f} 峰值队列{m['peak_queue_depth']} "
+            f"利用率{m['utilisation']:.0%}"
+            for name, m in self.report.items()
+        ]
+        bottleneck = self.bottleneck()
+        return " | ".join(parts) + f" | 瓶颈: {STAGE_LABELS.get(bottleneck, bottleneck) if bottleneck else '无'}"
+
+class GenerationPipeline:
+    """三阶段生成流水线：API（全局调度器）→ 下载 → 解码/转换"""
+
+    def __init__(self, scheduler: JobScheduler, download_workers: int = 8, decode_workers: int = 2,
+                 queue_size: int = 64):
+        self.scheduler = scheduler
+        # API阶段的工作线程由调度器管理，这里只统计经由流水线提交的请求
+        self.api_clock = StageClock("api")
+        self.download = PipelineStage("download", download_workers, queue_size)
+        self.decode = PipelineStage("decode", decode_workers, queue_size)
+        self._lock = threading.Lock()
+        # 进行中的API请求: 合并键 -> API阶段Future
+        self._inflight: Dict[str, Future] = {}
+        # 每个API阶段Future上挂接的未取消结果数，全部取消后才撤回API请求
+        self._subscribers: "weakref.WeakKeyDictionary[Future, int]" = weakref.WeakKeyDictionary()
+        # 合并统计，字段与 SingleFlight.get_metrics 一致
+        self._coalesce_requests = 0
+        self._coalesce_executions = 0
+        self._coalesced = 0
+
+    def begin_run(self) -> PipelineRun:
+        """开始一个统计窗口，之后用 PipelineRun.track 登记本次运行的结果Future"""
+        return PipelineRun({
+            "api": (self.api_clock, lambda: self.scheduler.get_metrics()["max_concurrency"]),
+            "download": (self.download.clock, lambda: self.download.workers),
+            "decode": (self.decode.clock, lambda: self.decode.workers),
+        })
+
+    def submit(self, request_fn: Callable[[], str], download_fn: Callable[[str], bytes],
+               decode_fn: Callable[[bytes], Any], priority: Any = "interactive",
+               key: Optional[str] = None, coalesce_key: Optional[str] = None,
+               run: Optional[PipelineRun] = None) -> Future:
+        """
+        提交一次生成
+
+        Args:
+            request_fn: API阶段，返回图像URL
+            download_fn: 下载阶段，参数为URL，返回图像字节
+            decode_fn: 解码/转换阶段，参数为图像字节
+            priority: API阶段的调度优先级
+            key: API阶段的公平调度键
+            coalesce_key: 请求指纹；与进行中的请求相同时不再进入调度器，
+                而是挂接到已有请求的Future上，等待者不占用API并发槽位
+            run: 统计窗口，结果Future会登记到该窗口
+
+        Returns:
+            Future: 结果为 (decode_fn的返回值, 图像URL)；任一阶段失败时携带该阶段的异常
+        """
+        result = Future()
+        with self._lock:
+            api_future = self._inflight.get(coalesce_key) if coalesce_key else None
+            leader = api_future is None
+            if leader:
+                api_future = self._schedule(request_fn, priority, key)
+                if coalesce_key:
+                    self._inflight[coalesce_key] = api_future
+            else:
+                self._coalesced += 1
+            if coalesce_key:
+                self._coalesce_requests += 1
+                self._coalesce_executions += leader
+            self._subscribers[api_future] = self._subscribers.get(api_future, 0) + 1
+        if leader and coalesce_key:
+            # 在锁外注册：Future已完成时回调会在当前线程立即执行
+            api_future.add_done_callback(lambda f: self._release(coalesce_key, f))
+        if run is not None:
+            run.track(result)
+
+        # 结果被取消（如异步任务过期）时，撤回仍在排队的API请求；
+        # 使用弱引用，避免两个Future的回调互相引用形成只能由GC回收的循环
+        api_ref = weakref.ref(api_future)
+        result.add_done_callback(lambda f: self._unsubscribe(api_ref) if f.cancelled() else None)
+
+        def chain(upstream: Future, next_step: Callable[[Any], None]):
+            def on_done(f: Future):
+                if result.done():
+                    return
+                if f.cancelled():
+                    result.cancel()
+                    return
+                error = f.exception()
+                if error is not None:
+                    _set_future(result, error=error)
+                    return
+                try:
+                    next_step(f.result())
+                except BaseException as e:
+                    _set_future(result, error=e)
+            upstream.add_done_callback(on_done)
+
+        def after_api(url: str):
+            chain(self.download.submit(download_fn, url), lambda data: after_download(url, data))
+
+        def after_download(url: str, data: bytes):
+            chain(self.decode.submit(decode_fn, data), lambda image: _set_future(result, value=(image, url)))
+
+        chain(api_future, after_api)
+        return result
+
+    def _schedule(self, request_fn: Callable[[], str], priority: Any, key: Optional[str]) -> Future:
+        """把API阶段提交到全局调度器，并记录该阶段的排队和执行时间"""
+        clock = self.api_clock
+
+        def timed_request():
+            clock.start()
+            try:
+                return request_fn()
+            finally:
+                clock.finish()
+
+        clock.enqueue()
+        try:
+            api_future = self.scheduler.submit(timed_request, priority=priority, key=key)
+        except BaseException:
+            clock.discard()
+            raise
+        # 排队中被取消的请求不会执行，需从排队数中移除
+        api_future.add_done_callback(lambda f: clock.discard() if f.cancelled() else None)
+        return api_future
+
+    def _release(self, coalesce_key: str, api_future: Future):
+        """API请求完成后移除合并记录，之后的相同请求会重新发起"""
+        with self._lock:
+            if self._inflight.get(coalesce_key) is api_future:
+                del self._inflight[coalesce_key]
+
+    def _unsubscribe(self, api_ref: "weakref.ref"):
+        """一个结果被取消；挂接在同一API请求上的结果全部取消后才撤回该请求"""
+        api_future = api_ref()
+        if api_future is None:
+            # 已被回收说明它早已完成
+            return
+        with self._lock:
+            remaining = self._subscribers.get(api_future, 1) - 1
+            self._subscribers[api_future] = remaining
+        if remaining <= 0:
+            api_future.cancel()
+
+    def get_coalesce_metrics(self) -> Dict[str, int]:
+        """获取提交阶段的请求合并统计"""
+        with self._lock:
+            return {
+                "requests": self._coalesce_requests,
+                "executions": self._coalesce_executions,
+                "coalesced": self._coalesced,
+                "in_flight": len(self._inflight),
+            }
+
+    def get_metrics(self) -> Dict[str, Dict[str, Any]]:
+        """获取各阶段的当前状态（运行期间的负载统计见 PipelineRun.report）"""
+        api = self.scheduler.get_metrics()
+        return {
+            "api": {
+                "workers": api["max_concurrency"],
+                "busy": self.api_clock.busy,
+                "queue_depth": self.api_clock.queued,
+                "processed": api["completed"] + api["failed"],
+                "failed": api["failed"],
+                "coalesced": self._coalesced,
+            },
+            "download": self.download.get_metrics(),
+            "decode": self.decode.get_metrics(),
+        }
+
+def _set_future(future: Future, value: Any = None, error: Optional[BaseException] = None):
+    """设置Future结果，忽略已被取消或已完成的情况"""
+    try:
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(value)
+    except Exception:
+        pass
+
+# 插件全局唯一的流水线实例
+_pipeline: Optional[GenerationPipeline] = None
+_pipeline_lock = threading.Lock()
+
+def get_pipeline() -> GenerationPipeline:
+    """获取插件全局共享的生成流水线"""
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is None:
+            _pipeline = GenerationPipeline(
+                get_scheduler(),
+                download_workers=default_config.get_config('download_workers', 8),
+                decode_workers=default_config.get_config('decode_workers', 2),
+                queue_size=default_config.get_config('pipeline_queue_size', 64),
+            )
+        return _pipeline
@@ -0,0 +1,235 @@
+"""
+全局作业调度器
+为整个插件提供一个长期存活的工作线程池，替代每次节点执行临时创建的线程池。
+支持优先级（交互/批量）、按键公平轮转、全局并发上限和队列深度统计。
+"""
+
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional
+try:
+    from .config import default_config
+except ImportError:
+    from config import default_config
+
+# 优先级：数值越小越先执行
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+
+PRIORITY_NAMES = {
+    "interactive": PRIORITY_INTERACTIVE,
+    "batch": PRIORITY_BATCH,
+}
+
+def resolve_priority(priority: Any) -> int:
+    """将优先级名称或数值统一转换为优先级数值，未知值按交互优先级处理"""
+    if isinstance(priority, str):
+        return PRIORITY_NAMES.get(priority.lower(), PRIORITY_INTERACTIVE)
+    if priority in PRIORITY_NAMES.values():
+        return priority
+    return PRIORITY_INTERACTIVE
+
+def new_fairness_key(prefix: str = "job") -> str:
+    """生成一个唯一的公平调度键，通常每次节点执行使用一个"""
+    return f"{prefix}-{uuid.uuid4().hex[:12]}"
+
+class _Job:
+    """调度队列中的单个作业"""
+
+    __slots__ = ("future", "fn", "args", "kwargs", "priority", "key", "enqueued_at")
+
+    def __init__(self, fn: Callable, args: tuple, kwargs: dict, priority: int, key: str):
+        self.future = Future()
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.priority = priority
+        self.key = key
+        self.enqueued_at = time.monotonic()
+
+class JobScheduler:
+    """
+    优先级作业调度器
+
+    - 高优先级（交互）作业总是先于低优先级（批量）作业出队
+    - 同一优先级内按公平键轮转，一个大批量任务不会独占所有工作线程
+    - 工作线程数即全局并发上限，所有节点共享
+    """
+
+    def __init__(self, max_concurrency: int = 4, name: str = "FluxKontextWorker"):
+        """
+        初始化调度器
+
+        Args:
+            max_concurrency: 全局并发上限
+            name: 工作线程名前缀
+        """
+        self._name = name
+        self._cond = threading.Condition()
+        self._queues: Dict[int, "OrderedDict[str, deque]"] = {
+            priority: OrderedDict() for priority in sorted(PRIORITY_NAMES.values())
+        }
+        self._max_concurrency = max(1, int(max_concurrency))
+        self._workers = []
+        self._running = 0
+        self._shutdown = False
+
+        # 统计信息
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._cancelled = 0
+        self._total_wait = 0.0
+        self._started = 0
+
+    def submit(self, fn: Callable, *args, priority: Any = PRIORITY_INTERACTIVE,
+               key: Optional[str] = None, **kwargs) -> Future:
+        """
+        提交作业
+
+        Args:
+            fn: 要执行的函数
+            priority: 优先级名称或数值
+            key: 公平调度键，相同键的作业共享一个轮转槽位
+
+        Returns:
+            Future: 作业结果
+        """
+        job = _Job(fn, args, kwargs, resolve_priority(priority), key or "default")
+        with self._cond:
+            if self._shutdown:
+                raise RuntimeError("调度器已关闭，无法提交新作业")
+            queue = self._queues[job.priority].setdefault(job.key, deque())
+            queue.append(job)
+            self._submitted += 1
+            self._ensure_workers()
+            self._cond.notify()
+        return job.future
+
+    def set_max_concurrency(self, max_concurrency: int):
+        """调整全局并发上限，多余的工作线程会在当前作业完成后退出"""
+        with self._cond:
+            self._max_concurrency = max(1, int(max_concurrency))
+            self._ensure_workers()
+            self._cond.notify_all()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        获取调度统计信息
+
+        Returns:
+            Dict: 包含各优先级的队列深度、运行中作业数和累计计数
+        """
+        with self._cond:
+            queued = {
+                name: sum(len(q) for q in self._queues[priority].values())
+                for name, priority in PRIORITY_NAMES.items()
+            }
+            return {
+                "queued": queued,
+                "queue_depth": sum(queued.values()),
+                "active_keys": sum(len(self._queues[p]) for p in self._queues),
+                "running": self._running,
+                "max_concurrency": self._max_concurrency,
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "failed": self._failed,
+                "cancelled": self._cancelled,
+                "avg_wait_ms": (self._total_wait / self._started * 1000) if self._started else 0.0,
+            }
+
+    def shutdown(self, wait: bool = True):
+        """关闭调度器，取消尚未开始的作业"""
+        with self._cond:
+            self._shutdown = True
+            for queues in self._queues.values():
+                for queue in queues.values():
+                    for job in queue:
+                        job.future.cancel()
+                        self._cancelled += 1
+                queues.clear()
+            self._cond.notify_all()
+            workers = list(self._workers)
+        if wait:
+            for worker in workers:
+                worker.join()
+
+    def _ensure_workers(self):
+        """按需启动工作线程（调用方需持有锁）"""
+        self._workers = [w for w in self._workers if w.is_alive()]
+        while len(self._workers) < self._max_concurrency:
+            worker = threading.Thread(
+                target=self._worker_loop,
+                name=f"{self._name}-{len(self._workers)}",
+                daemon=True
+            )
+            self._workers.append(worker)
+            worker.start()
+
+    def _next_job(self) -> Optional[_Job]:
+        """按优先级和公平键轮转取出下一个作业（调用方需持有锁）"""
+        for priority in sorted(self._queues):
+            queues = self._queues[priority]
+            if not queues:
+                continue
+            key, queue = next(iter(queues.items()))
+            job = queue.popleft()
+            # 取出后将该键移到末尾，实现同优先级内的轮转
+            del queues[key]
+            if queue:
+                queues[key] = queue
+            return job
+        return None
+
+    def _worker_loop(self):
+        """工作线程主循环"""
+        current = threading.current_thread()
+        while True:
+            with self._cond:
+                job = None
+                while job is None:
+                    surplus = len([w for w in self._workers if w.is_alive()]) > self._max_concurrency
+                    if self._shutdown or surplus:
+                        if current in self._workers:
+                            self._workers.remove(current)
+                        return
+                    job = self._next_job()
+                    if job is None:
+                        self._cond.wait()
+                if not job.future.set_running_or_notify_cancel():
+                    self._cancelled += 1
+                    continue
+                self._running += 1
+                self._started += 1
+                self._total_wait += time.monotonic() - job.enqueued_at
+
+            try:
+                result = job.fn(*job.args, **job.kwargs)
+            except BaseException as e:
+                job.future.set_exception(e)
+                failed = True
+            else:
+                job.future.set_result(result)
+                failed = False
+
+            with self._cond:
+                self._running -= 1
+                if failed:
+                    self._failed += 1
+                else:
+                    self._completed += 1
+
+# 插件全局唯一的调度器实例
+_scheduler: Optional[JobScheduler] = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler() -> JobScheduler:
+    """获取插件全局共享的调度器实例"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = JobScheduler(max_concurrency=default_config.get_config('max_concurrency', 4))
+        return _scheduler
@@ -0,0 +1,125 @@
+"""
+并发请求合并（single-flight）
+相同指纹的并发请求只执行一次底层调用，结果分发给所有等待者
+"""
+
+import hashlib
+import json
+import threading
+from typing import Any, Callable, Dict, Hashable
+
+def make_fingerprint(*parts: Any) -> str:
+    """
+    根据请求参数生成规范化指纹
+
+    字典按键排序序列化，保证参数顺序不同但内容相同的请求得到相同指纹。
+
+    Args:
+        parts: 参与指纹计算的参数（需可JSON序列化，bytes会直接参与哈希）
+
+    Returns:
+        str: 十六进制SHA-256指纹
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, (bytes, bytearray, memoryview)):
+            digest.update(bytes(part))
+        else:
+            digest.update(json.dumps(part, sort_keys=True, ensure_ascii=False, default=str).encode('utf-8'))
+        # 分隔符，避免不同参数拼接后产生相同字节序列
+        digest.update(b'\x00')
+    return digest.hexdigest()
+
+class _Call:
+    """一次正在进行中的调用"""
+
+    __slots__ = ("event", "result", "error", "waiters")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+class SingleFlight:
+    """
+    合并相同键的并发调用
+
+    第一个到达的调用者（leader）执行函数，其余调用者等待并共享其结果或异常。
+    调用完成后立即移除记录，不做结果缓存。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._requests = 0
+        self._executions = 0
+        self._coalesced = 0
+
+    def do(self, key: Hashable, fn: Callable, *args, **kwargs) -> Any:
+        """
+        执行或加入一次调用
+
+        Args:
+            key: 请求指纹
+            fn: 实际执行的函数
+
+        Returns:
+            Any: 函数返回值（所有等待者共享同一个对象）
+        """
+        with self._lock:
+            self._requests += 1
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self._coalesced += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self._executions += 1
+                leader = True
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+    def get_metrics(self) -> Dict[str, int]:
+        """获取合并统计信息"""
+        with self._lock:
+            return {
+                "requests": self._requests,
+                "executions": self._executions,
+                "coalesced": self._coalesced,
+                "in_flight": len(self._calls),
+            }
+
+# 按用途区分的全局实例，例如 "generation"、"upload"
+_flights: Dict[str, SingleFlight] = {}
+_flights_lock = threading.Lock()
+
+def get_flight(name: str) -> SingleFlight:
+    """获取指定用途的全局SingleFlight实例"""
+    with _flights_lock:
+        if name not in _flights:
+            _flights[name] = SingleFlight()
+        return _flights[name]
+
+def get_coalesce_metrics() -> Dict[str, Dict[str, int]]:
+    """获取所有SingleFlight实例的合并统计"""
+    with _flights_lock:
+        flights = dict(_flights)
+    return {name: flight.get_metrics() for name, flight in flights.items()}
@@ -10,28 +10,61 @@ from PIL import Image
 from typing import Optional, Union, List, Tuple
 import torch
 import re
+import math
+import tempfile
+import threading
 from urllib.parse import urlparse
 
-def download_image(url: str, timeout: int = 30) -> Optional[Image.Image]:
+def fetch_image_bytes(url: str, timeout: int = 30,
+                      session: Optional[requests.Session] = None) -> bytes:
+    """
+    从URL下载图像的原始字节
+    
+    Args:
+        url: 图像URL
+        timeout: 超时时间（秒）
+        session: 可选的HTTP会话，传入时复用其连接池
+        
+    Returns:
+        bytes: 图像文件内容
+        
+    Raises:
+        requests.exceptions.RequestException: 下载失败
+    """
+    headers = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+    }
+    with (session or requests).get(url, headers=headers, timeout=timeout) as response:
+        response.raise_for_status()
+        return response.content
+
+def decode_image(data: bytes) -> Image.Image:
+    """
+    将图像字节完整解码为PIL图像
+    
+    立即完成解码：同一图像可能被多个合并请求的调用方在不同线程中共享，
+    解码后即可关闭缓冲区，不再持有原始字节。
+    """
+    with io.BytesIO(data) as buffer:
+        image = Image.open(buffer)
+        image.load()
+    return image
+
+def download_image(url: str, timeout: int = 30,
+                   session: Optional[requests.Session] = None) -> Optional[Image.Image]:
     """
     从URL下载图像
     
     Args:
         url: 图像URL
         timeout: 超时时间（秒）
+        session: 可选的HTTP会话，传入时复用其连接池
         
     Returns:
         PIL.Image对象，如果下载失败返回None
     """
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        }
-        response = requests.get(url, headers=headers, timeout=timeout)
-        response.raise_for_status()
-        
-        image = Image.open(io.BytesIO(response.content))
-        return image
+        return decode_image(fetch_image_bytes(url, timeout=timeout, session=session))
     except Exception as e:
         print(f"图像下载失败，错误: {str(e)}")
         return None
@@ -57,28 +90,215 @@ def tensor_to_pil(tensor: torch.Tensor) -> List[Image.Image]:
         
     return images
 
+def _to_rgb_array(pil_image: Image.Image, size: Optional[Tuple[int, int]] = None) -> np.ndarray:
+    """将PIL图像转换为uint8 RGB数组，尺寸不一致时缩放到指定尺寸（宽, 高）"""
+    # 确保图像是RGB格式
+    if pil_image.mode != 'RGB':
+        pil_image = pil_image.convert('RGB')
+    if size is not None and pil_image.size != size:
+        pil_image = pil_image.resize(size, Image.LANCZOS)
+    return np.array(pil_image)
+
 def pil_to_tensor(pil_images: Union[Image.Image, List[Image.Image]]) -> torch.Tensor:
     """
     将单个PIL图像或PIL图像列表转换为ComfyUI图像张量
+    
+    预先分配输出张量并逐张写入，避免同时持有所有float32中间副本再拼接。
+    尺寸与第一张不一致的图像会被缩放到第一张的尺寸。
     """
     if not isinstance(pil_images, list):
         pil_images = [pil_images]
 
-    tensors = []
-    for pil_image in pil_images:
-        # 确保图像是RGB格式
-        if pil_image.mode != 'RGB':
-            pil_image = pil_image.convert('RGB')
-            
-        img_array = np.array(pil_image).astype(np.float32) / 255.0
-        tensor = torch.from_numpy(img_array)[None,]
-        tensors.append(tensor)
-    
-    if not tensors:
+    if not pil_images:
         # 如果列表为空，返回一个空的占位符张量
         return torch.empty((0, 1, 1, 3), dtype=torch.float32)
+
+    width, height = pil_images[0].size
+    output = torch.empty((len(pil_images), height, width, 3), dtype=torch.float32)
+    for i, pil_image in enumerate(pil_images):
+        output[i].copy_(torch.from_numpy(_to_rgb_array(pil_image, (width, height))))
+    return output.div_(255.0)
+
+class FrameSpillBuffer:
+    """
+    结果帧的磁盘缓冲区，用于大批量输出时限制内存峰值
+    
+    每张结果图像解码后立即以uint8写入临时文件，调用方随即可以释放PIL图像；
+    最后按内存预算分块读回，直接写入预分配的输出张量。
+    除输出张量本身外，内存占用只有一个固定大小的读取缓冲区。
+    """
+
+    def __init__(self, capacity: int, memory_budget_mb: float = 256, directory: Optional[str] = None):
+        """
+        初始化缓冲区
+        
+        Args:
+            capacity: 最多容纳的帧数
+            memory_budget_mb: 构建输出张量时读取缓冲区的内存预算（MB）
+            directory: 临时文件目录，默认使用系统临时目录
+        """
+        self.capacity = capacity
+        self.memory_budget = max(1, int(memory_budget_mb * 1024 * 1024))
+        self._directory = directory
+        self._file = None
+        self._size: Optional[Tuple[int, int]] = None
+        self._count = 0
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def frame_bytes(self) -> int:
+        width, height = self._size
+        return width * height * 3
+
+    def append(self, pil_image: Image.Image):
+        """
+        写入一帧（线程安全）；尺寸与第一帧不一致时缩放到第一帧的尺寸
+        
+        缓冲区关闭后（如异步任务过期）仍在进行的解码再写入会抛出异常，不会重新创建临时文件。
+        """
+        with self._lock:
+            if self._closed:
+                raise ValueError("缓冲区已关闭，无法继续写入")
+            if self._count >= self.capacity:
+                raise ValueError(f"缓冲区已满，最多容纳 {self.capacity} 帧")
+            if self._file is None:
+                self._size = pil_image.size
+                self._file = tempfile.TemporaryFile(prefix="flux_kontext_frames_", dir=self._directory)
+            frame = np.ascontiguousarray(_to_rgb_array(pil_image, self._size))
+            self._file.seek(self._count * self.frame_bytes)
+            self._file.write(memoryview(frame).cast('B'))
+            self._count += 1
+
+    def to_tensor(self) -> torch.Tensor:
+        """按内存预算分块读回所有帧，构建ComfyUI图像张量"""
+        with self._lock:
+            if self._closed:
+                raise ValueError("缓冲区已关闭，无法读取")
+            if self._count == 0:
+                return torch.empty((0, 1, 1, 3), dtype=torch.float32)
+
+            width, height = self._size
+            output = torch.empty((self._count, height, width, 3), dtype=torch.float32)
+            chunk_frames = max(1, min(self._count, self.memory_budget // self.frame_bytes))
+            staging = np.empty((chunk_frames, height, width, 3), dtype=np.uint8)
+
+            self._file.flush()
+            self._file.seek(0)
+            for start in range(0, self._count, chunk_frames):
+                count = min(chunk_frames, self._count - start)
+                chunk = staging[:count]
+                if self._file.readinto(memoryview(chunk).cast('B')) != chunk.nbytes:
+                    raise IOError("读取缓冲帧失败，临时文件不完整")
+                # uint8直接复制进float32输出，转换过程中不产生额外的中间副本
+                output[start:start + count].copy_(torch.from_numpy(chunk)).div_(255.0)
+            return output
+
+    def close(self):
+        """关闭并删除临时文件；关闭后不可再写入或读取"""
+        with self._lock:
+            self._closed = True
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+def _plan_composite(sizes: List[Tuple[int, int]], layout: str, scale: float) -> Tuple[Tuple[int, int], List[Tuple[int, int, int, int]]]:
+    """
+    计算拼接画布尺寸和每张图像的位置
+    
+    Args:
+        sizes: 每张图像的 (高, 宽)
+        layout: 布局方式 ('horizontal', 'vertical', 'grid')
+        scale: 整体缩放比例
+        
+    Returns:
+        Tuple: ((画布高, 画布宽), [(y, x, 高, 宽), ...])
+    """
+    placements = []
+    if layout == "vertical":
+        # 统一宽度，纵向排列
+        canvas_w = max(1, round(max(w for _, w in sizes) * scale))
+        y = 0
+        for h, w in sizes:
+            tile_h = max(1, round(h * canvas_w / w))
+            placements.append((y, 0, tile_h, canvas_w))
+            y += tile_h
+        return (y, canvas_w), placements
+
+    if layout == "grid":
+        # 统一格子大小，按比例缩放后居中放置
+        cols = math.ceil(math.sqrt(len(sizes)))
+        rows = math.ceil(len(sizes) / cols)
+        cell_h = max(1, round(max(h for h, _ in sizes) * scale))
+        cell_w = max(1, round(max(w for _, w in sizes) * scale))
+        for i, (h, w) in enumerate(sizes):
+            fit = min(cell_h / h, cell_w / w)
+            tile_h, tile_w = max(1, min(cell_h, round(h * fit))), max(1, min(cell_w, round(w * fit)))
+            y = (i // cols) * cell_h + (cell_h - tile_h) // 2
+            x = (i % cols) * cell_w + (cell_w - tile_w) // 2
+            placements.append((y, x, tile_h, tile_w))
+        return (rows * cell_h, cols * cell_w), placements
+
+    # 默认水平排列：统一高度
+    canvas_h = max(1, round(max(h for h, _ in sizes) * scale))
+    x = 0
+    for h, w in sizes:
+        tile_w = max(1, round(w * canvas_h / h))
+        placements.append((0, x, canvas_h, tile_w))
+        x += tile_w
+    return (canvas_h, x), placements
+
+def composite_references(tensors: List[torch.Tensor], layout: str = "horizontal",
+                         max_pixels: int = 1024 * 1024, background: float = 1.0) -> torch.Tensor:
+    """
+    将多张参考图像拼接成一张画布，用于一次性上传
+    
+    使用张量插值和切片赋值完成缩放与拼接，不经过PIL逐张粘贴。
+    画布总像素超过max_pixels时会整体等比缩小。
+    
+    Args:
+        tensors: ComfyUI图像张量列表（B, H, W, C），每个张量取第一张
+        layout: 布局方式 ('horizontal', 'vertical', 'grid')
+        max_pixels: 画布最大像素数
+        background: 空白区域的填充值（0-1）
         
-    return torch.cat(tensors, dim=0)
+    Returns:
+        torch.Tensor: 拼接后的图像张量（1, H, W, 3）
+    """
+    images = [t[0, :, :, :3] for t in tensors if isinstance(t, torch.Tensor) and t.shape[0] > 0]
+    if not images:
+        return torch.empty((0, 1, 1, 3), dtype=torch.float32)
+
+    sizes = [(img.shape[0], img.shape[1]) for img in images]
+    (natural_h, natural_w), _ = _plan_composite(sizes, layout, 1.0)
+    scale = min(1.0, math.sqrt(max_pixels / (natural_h * natural_w))) if max_pixels > 0 else 1.0
+    (canvas_h, canvas_w), placements = _plan_composite(sizes, layout, scale)
+    # 取整可能使画布略超预算，逐步收缩直到满足
+    while max_pixels > 0 and canvas_h * canvas_w > max_pixels and scale > 0.01:
+        scale *= 0.99
+        (canvas_h, canvas_w), placements = _plan_composite(sizes, layout, scale)
+
+    device = images[0].device
+    canvas = torch.full((canvas_h, canvas_w, 3), float(background), dtype=torch.float32, device=device)
+    for img, (y, x, tile_h, tile_w) in zip(images, placements):
+        tile = img.to(device=device, dtype=torch.float32)
+        if (tile_h, tile_w) != tuple(tile.shape[:2]):
+            tile = torch.nn.functional.interpolate(
+                tile.permute(2, 0, 1)[None], size=(tile_h, tile_w),
+                mode="bilinear", align_corners=False, antialias=True
+            )[0].permute(1, 2, 0)
+        canvas[y:y + tile_h, x:x + tile_w] = tile
+
+    return canvas.clamp_(0, 1)[None,]
 
 def tensor_to_base64(tensor: torch.Tensor, image_format: str = "png") -> str:
     """